@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration
+
+Picked up from the working directory by the Procfile and the Docker image
+"""
+import os
+
+# Every Server-Sent Events stream holds a thread for as long as it is open, so the workers
+# are threaded: a sync worker would be stuck on one stream and killed after the timeout.
+# The gthread worker keeps its heartbeat going while its threads stream.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+
+
+def stream_capacity(worker):
+    """Returns how many event streams a worker can hold open, or None if they do not take a thread
+    Half of the threads of a threaded worker are kept for the other requests, and a sync
+    worker, which only has the one, takes no streams at all
+    """
+    # pylint: disable=import-outside-toplevel
+    from gunicorn.workers.gthread import ThreadWorker
+    from gunicorn.workers.sync import SyncWorker
+
+    if isinstance(worker, ThreadWorker):
+        return worker.cfg.threads // 2
+    if isinstance(worker, SyncWorker):
+        return 0
+    return None
+
+
+def post_worker_init(worker):
+    """Starts the background threads in each worker once it has loaded the app"""
+    from service import routes  # pylint: disable=import-outside-toplevel
+
+    routes.start_background_tasks(stream_capacity(worker))
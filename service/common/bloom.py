@@ -0,0 +1,146 @@
+"""
+Bloom Filter
+
+This module contains a thread-safe Bloom filter of keys that can be
+rebuilt from a scan of the database while keys are still being added
+"""
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    """A Bloom filter that answers whether a key may exist or definitely does not
+
+    Until it has been built for the first time, and while it is disabled with a
+    capacity of 0, every key may exist. Keys added during a rebuild are kept, so a
+    key is never lost between the scan and the swap.
+    """
+
+    def __init__(self, capacity: int = 0, error_rate: float = 0.01):
+        self._lock = threading.Lock()
+        self._rebuilding = threading.Lock()
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.ready = False
+        self.size = 0
+        self.hashes = 0
+        self.count = 0
+        self._bits = bytearray()
+        self._pending = None
+        self.checks = 0
+        self.rejected = 0
+        self.false_positives = 0
+        self.rebuilds = 0
+
+    def configure(self, capacity: int, error_rate: float):
+        """Changes the expected number of keys and the target false positive rate
+        The filter lets every key through until it is rebuilt
+        """
+        with self._lock:
+            self.capacity = capacity
+            self.error_rate = error_rate
+            self.ready = False
+
+    @staticmethod
+    def _shape(capacity: int, error_rate: float) -> tuple:
+        """Returns the number of bits and hashes that hold capacity keys at error_rate"""
+        size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        return size, max(1, round(size / capacity * math.log(2)))
+
+    @staticmethod
+    def _positions(key, size: int, hashes: int):
+        """Yields the bit positions of a key, from two halves of one digest"""
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(hashes):
+            yield (first + i * second) % size
+
+    @classmethod
+    def _set(cls, bits: bytearray, key, size: int, hashes: int):
+        for position in cls._positions(key, size, hashes):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def add(self, key):
+        """Adds a key to the filter"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(key)
+            if self.ready:
+                self._set(self._bits, key, self.size, self.hashes)
+                self.count += 1
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            self.checks += 1
+            if not self.ready:
+                return True
+            for position in self._positions(key, self.size, self.hashes):
+                if not self._bits[position >> 3] & 1 << (position & 7):
+                    self.rejected += 1
+                    return False
+            return True
+
+    def false_positive(self, count: int = 1):
+        """Records that count keys the filter let through did not exist"""
+        with self._lock:
+            self.false_positives += count
+
+    def rebuild(self, keys, count: int) -> bool:
+        """Replaces the filter with one built from keys, sized for at least count of them
+        :param keys: an iterable of every existing key
+        :param count: the number of keys, used to size the filter before they are read
+        :return: False if the filter is disabled or another rebuild is running
+        :rtype: bool
+        """
+        if self.capacity <= 0 or not self._rebuilding.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return False
+        try:
+            with self._lock:
+                self._pending = []
+                # Leave room for the keys created until the next rebuild
+                size, hashes = self._shape(max(self.capacity, 2 * count), self.error_rate)
+            bits = bytearray((size + 7) // 8)
+            built = 0
+            for key in keys:
+                self._set(bits, key, size, hashes)
+                built += 1
+            with self._lock:
+                for key in self._pending:
+                    self._set(bits, key, size, hashes)
+                built += len(self._pending)
+                self._bits, self.size, self.hashes, self.count = bits, size, hashes, built
+                self.ready = True
+                self.rebuilds += 1
+            return True
+        finally:
+            with self._lock:
+                self._pending = None
+            self._rebuilding.release()
+
+    def stats(self) -> dict:
+        """Returns the shape, memory use and false positive rates of the filter
+        The estimated rate follows from the number of keys; the observed rate is the share of
+        absent keys that got through, as reported with false_positive()
+        """
+        with self._lock:
+            estimated = 0.0
+            if self.ready and self.size:
+                estimated = (1 - math.exp(-self.hashes * self.count / self.size)) ** self.hashes
+            absent = self.rejected + self.false_positives
+            return {
+                "ready": self.ready,
+                "capacity": self.capacity,
+                "keys": self.count,
+                "bits": self.size,
+                "hashes": self.hashes,
+                "memory_bytes": len(self._bits),
+                "target_false_positive_rate": self.error_rate,
+                "estimated_false_positive_rate": estimated,
+                "observed_false_positive_rate": self.false_positives / absent if absent else 0.0,
+                "checks": self.checks,
+                "rejected": self.rejected,
+                "false_positives": self.false_positives,
+                "rebuilds": self.rebuilds,
+            }
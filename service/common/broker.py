@@ -0,0 +1,121 @@
+"""
+Event Broker
+
+This module contains an in-process fan-out of events to subscribers
+that each read from their own bounded buffer
+"""
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger("flask.app")
+
+
+class Subscription:
+    """One subscriber's buffer of events
+
+    A subscriber that lets its buffer fill up is a slow consumer: it is closed
+    and dropped by the broker instead of holding up the publishers.
+    """
+
+    def __init__(self, broker, maxsize: int):
+        self.broker = broker
+        self.maxsize = maxsize
+        self.closed = False
+        self.dropped = False
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def put(self, event) -> bool:
+        """Buffers an event, returning False if the buffer is full"""
+        with self._ready:
+            if self.closed:
+                return True
+            if len(self._events) >= self.maxsize:
+                return False
+            self._events.append(event)
+            self._ready.notify()
+            return True
+
+    def get(self, timeout: float = None) -> list:
+        """Returns the buffered events, waiting up to timeout seconds for one to arrive
+        An empty list means that the wait timed out or the subscription was closed
+        """
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait(timeout)
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self, dropped: bool = False):
+        """Closes the subscription and removes it from its broker"""
+        with self._ready:
+            self.closed = True
+            self.dropped = self.dropped or dropped
+            self._ready.notify()
+        self.broker.unsubscribe(self)
+
+
+class EventBroker:
+    """Publishes events to every current subscriber"""
+
+    def __init__(self, name: str, buffer_size: int = 256, max_subscribers: int = 100):
+        self.name = name
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.published = 0
+        self.slow_consumers = 0
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    @property
+    def subscribers(self) -> int:
+        """The number of current subscribers, read without taking the lock"""
+        return len(self._subscriptions)
+
+    def configure(self, buffer_size: int, max_subscribers: int):
+        """Changes the buffer size of new subscriptions and the number of subscribers allowed"""
+        with self._lock:
+            self.buffer_size = buffer_size
+            self.max_subscribers = max_subscribers
+
+    def subscribe(self):
+        """Returns a new Subscription, or None if there are already max_subscribers"""
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self, self.buffer_size)
+            self._subscriptions.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Stops sending events to a subscription"""
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, events: list):
+        """Sends events to every subscriber, dropping the ones that cannot keep up"""
+        if not events:
+            return
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+            self.published += len(events)
+        for subscription in subscriptions:
+            if all(subscription.put(event) for event in events):
+                continue
+            logger.warning("%s dropped a slow consumer", self.name)
+            with self._lock:
+                self.slow_consumers += 1
+            subscription.close(dropped=True)
+
+    def stats(self) -> dict:
+        """Returns the counters and current number of subscribers"""
+        with self._lock:
+            return {
+                "subscribers": len(self._subscriptions),
+                "max_subscribers": self.max_subscribers,
+                "buffer_size": self.buffer_size,
+                "published": self.published,
+                "slow_consumers": self.slow_consumers,
+            }
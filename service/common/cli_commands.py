@@ -1,8 +1,11 @@
 """
 Flask CLI Command Extensions
 """
+import time
+import click
 from service import app
-from service.models import db
+from service.models import InventoryOutbox, Reservation, db
+from service.common.sinks import JsonlSink
 
 
 ######################################################################
@@ -19,3 +22,40 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to release the expired stock reservations
+# Usage:
+#   flask sweep-reservations
+######################################################################
+@app.cli.command("sweep-reservations")
+def sweep_reservations():
+    """
+    Puts the copies of every expired reservation back into the inventory
+    """
+    released = Reservation.release_expired(app.config["RESERVATION_SWEEP_BATCH"])
+    print(f"Released {released} expired reservations")
+
+
+######################################################################
+# Command to publish the outbox of inventory changes
+# Usage:
+#   flask outbox-relay [--output FILE] [--batch-size N] [--follow]
+######################################################################
+@app.cli.command("outbox-relay")
+@click.option("--output", default=None, help="The JSONL file the changes are appended to")
+@click.option("--batch-size", type=int, default=None, help="The number of changes written per transaction")
+@click.option("--follow", is_flag=True, help="Keep relaying new changes until interrupted")
+def outbox_relay(output, batch_size, follow):
+    """
+    Moves the committed inventory changes from the outbox to a JSONL file in order
+    """
+    sink = JsonlSink(output or app.config["OUTBOX_JSONL_PATH"])
+    batch_size = batch_size or app.config["OUTBOX_RELAY_BATCH"]
+    while True:
+        relayed = InventoryOutbox.drain(sink, batch_size)
+        print(f"Relayed {relayed} outbox entries")
+        if not follow:
+            return
+        time.sleep(app.config["OUTBOX_RELAY_INTERVAL"])
@@ -0,0 +1,95 @@
+"""
+Coalescer
+
+This module contains a write coalescer that buffers values per key for a
+few milliseconds and hands them to a flush function in one batch
+"""
+import logging
+import threading
+from concurrent.futures import Future
+
+logger = logging.getLogger("flask.app")
+
+
+class Coalescer:
+    """Buffers values per key on a background thread and flushes them in batches
+
+    The flush function receives a dict of key -> list of values and returns a dict of
+    key -> list of results in the same order. Each submitter gets a Future that
+    resolves to its own result once the flush has finished.
+    """
+
+    def __init__(self, name: str, flush):
+        self.name = name
+        self.flush = flush
+        self.interval = 0.0
+        self.max_pending = 0
+        self._lock = threading.Condition()
+        self._pending = {}
+        self._size = 0
+        self._stopped = False
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """True while the background thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float, max_pending: int):
+        """Starts flushing every interval seconds, or as soon as max_pending values are buffered
+        An interval of 0 or less leaves the coalescer stopped
+        """
+        if interval <= 0 or self.running:
+            return
+        self.interval = interval
+        self.max_pending = max(1, max_pending)
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        logger.info("Started %s every %s seconds", self.name, interval)
+
+    def stop(self, timeout: float = None):
+        """Flushes what is buffered and stops the background thread"""
+        with self._lock:
+            self._stopped = True
+            self._lock.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, key, value) -> Future:
+        """Buffers value under key and returns a Future for its result"""
+        future = Future()
+        with self._lock:
+            if self._stopped or not self.running:
+                raise RuntimeError(f"{self.name} is not running")
+            self._pending.setdefault(key, []).append((value, future))
+            self._size += 1
+            if self._size >= self.max_pending:
+                self._lock.notify()
+        return future
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopped and self._size < self.max_pending:
+                    self._lock.wait(self.interval)
+                batch, self._pending, self._size = self._pending, {}, 0
+                stopped = self._stopped
+            if batch:
+                self._flush(batch)
+            if stopped:
+                return
+
+    def _flush(self, batch: dict):
+        try:
+            results = self.flush({key: [value for value, _ in entries] for key, entries in batch.items()})
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("%s flush failed: %s", self.name, error)
+            for entries in batch.values():
+                for _, future in entries:
+                    future.set_exception(error)
+            return
+        for key, entries in batch.items():
+            for (_, future), result in zip(entries, results[key]):
+                future.set_result(result)
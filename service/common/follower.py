@@ -0,0 +1,104 @@
+"""
+Feed Follower
+
+This module contains a daemon thread that reads an ordered feed after
+the last position it handed over, whenever it is woken up
+"""
+import logging
+import threading
+
+logger = logging.getLogger("flask.app")
+
+
+class FeedFollower:
+    """Hands the new pages of a feed to a function on a background thread
+
+    The feed is only read while active() is true. A follower that becomes active
+    again starts from head(), instead of reading what was written while nobody
+    was following.
+    """
+
+    def __init__(self, name: str, head, read, publish, active):
+        self.name = name
+        self.head = head
+        self.read = read
+        self.publish = publish
+        self.active = active
+        self.position = None
+        self.reads = 0
+        self.published = 0
+        self._lock = threading.Lock()
+        self._woken = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """True while the background thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float):
+        """Starts reading the feed whenever it is woken up, and at least every interval seconds"""
+        if self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name=self.name, daemon=True)
+        self._thread.start()
+        logger.info("Started %s", self.name)
+
+    def stop(self, timeout: float = None):
+        """Stops the background thread, waiting up to timeout seconds for it to finish"""
+        self._stopped.set()
+        self._woken.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        """Asks the background thread to read the feed, because something was written to it"""
+        self._woken.set()
+
+    def follow(self):
+        """Makes sure the follower has a position, so that nothing written from now on is skipped"""
+        if self.position is not None:
+            return
+        with self._lock:
+            if self.position is None:
+                self.position = self.head()
+
+    def catch_up(self):
+        """Hands over the pages written after the position until the feed has no more"""
+        with self._lock:
+            if not self.active():
+                self.position = None
+                return
+            if self.position is None:
+                self.position = self.head()
+            while True:
+                page = self.read(self.position)
+                self.reads += 1
+                if not page:
+                    return
+                self.publish(page)
+                self.published += len(page)
+                self.position = page[-1][0]
+
+    def stats(self) -> dict:
+        """Returns the counters of the follower"""
+        return {
+            "running": self.running,
+            "following": self.position is not None,
+            "reads": self.reads,
+            "published": self.published,
+        }
+
+    def _run(self, interval: float):
+        while not self._stopped.is_set():
+            self._woken.wait(interval)
+            self._woken.clear()
+            if self._stopped.is_set():
+                return
+            try:
+                self.catch_up()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error("%s failed: %s", self.name, error)
@@ -0,0 +1,101 @@
+"""
+Notification Listener
+
+This module contains a daemon thread that holds its own PostgreSQL
+connection, LISTENs on a channel and hands the notification payloads
+to a function
+"""
+import logging
+import select
+import threading
+
+logger = logging.getLogger("flask.app")
+
+
+class NotificationListener:
+    """Listens for PostgreSQL notifications on a background thread
+
+    Notifications sent while the listener is disconnected are lost, so resync is
+    called every time it (re)connects, before any notification is handed over.
+    """
+
+    def __init__(self, name: str, channel: str, connect, notify, resync=None):
+        self.name = name
+        self.channel = channel
+        self.connect = connect
+        self.notify = notify
+        self.resync = resync
+        self.received = 0
+        self.reconnects = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """True while the background thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, poll_interval: float = 1.0, retry_delay: float = 5.0):
+        """Starts listening, waking up every poll_interval seconds to check if it was stopped
+        A dropped connection is opened again after retry_delay seconds
+        """
+        if self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(poll_interval, retry_delay), name=self.name, daemon=True
+        )
+        self._thread.start()
+        logger.info("Started %s on channel %s", self.name, self.channel)
+
+    def stop(self, timeout: float = None):
+        """Stops the background thread, waiting up to timeout seconds for it to finish"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> dict:
+        """Returns the counters of the listener"""
+        return {"running": self.running, "received": self.received, "reconnects": self.reconnects}
+
+    def _run(self, poll_interval: float, retry_delay: float):
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                connection = self._listen()
+                while not self._stopped.is_set():
+                    self._receive(connection, poll_interval)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error("%s lost its connection: %s", self.name, error)
+                self.reconnects += 1
+                self._stopped.wait(retry_delay)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:  # pylint: disable=broad-except
+                        pass
+
+    def _listen(self):
+        connection = self.connect()
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        if self.resync is not None:
+            self.resync()
+        return connection
+
+    def _receive(self, connection, poll_interval: float):
+        if select.select([connection], [], [], poll_interval) == ([], [], []):
+            return
+        connection.poll()
+        payloads = [notification.payload for notification in connection.notifies]
+        connection.notifies.clear()
+        if not payloads:
+            return
+        self.received += len(payloads)
+        try:
+            self.notify(payloads)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("%s failed to handle notifications: %s", self.name, error)
@@ -0,0 +1,52 @@
+"""
+Periodic Tasks
+
+This module contains a small daemon thread that runs a function
+every few seconds until it is stopped
+"""
+import logging
+import threading
+
+logger = logging.getLogger("flask.app")
+
+
+class PeriodicTask:
+    """Runs a function on a background thread at a fixed interval"""
+
+    def __init__(self, name: str, func):
+        self.name = name
+        self.func = func
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        """True while the background thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float):
+        """Starts calling the function every interval seconds
+        An interval of 0 or less leaves the task stopped
+        """
+        if interval <= 0 or self.running:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(interval,), name=self.name, daemon=True
+        )
+        self._thread.start()
+        logger.info("Started %s every %s seconds", self.name, interval)
+
+    def stop(self, timeout: float = None):
+        """Stops the background thread, waiting up to timeout seconds for it to finish"""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, interval: float):
+        while not self._stopped.wait(interval):
+            try:
+                self.func()
+            except Exception as error:  # pylint: disable=broad-except
+                logger.error("%s failed: %s", self.name, error)
@@ -0,0 +1,24 @@
+"""
+Outbox Sinks
+
+This module contains the sinks the outbox relay can hand its batches to.
+A sink is any callable that takes a list of serialized outbox entries and
+raises if they could not be delivered
+"""
+import json
+import os
+
+
+class JsonlSink:
+    """Appends each entry to a file as one line of JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, entries: list):
+        with open(self.path, "a", encoding="utf-8") as output:
+            for entry in entries:
+                output.write(json.dumps(entry) + "\n")
+            output.flush()
+            # The relay removes the batch once this returns, so make sure it is on disk
+            os.fsync(output.fileno())
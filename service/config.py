@@ -14,6 +14,63 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Number of rows inserted per statement and commit by the bulk endpoints
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "500"))
+
+# Number of rows fetched from the database at a time when streaming NDJSON
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "1000"))
+
+# Page sizes for keyset pagination of the list endpoints
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# In-process cache of single-item lookups (a size of 0 disables it)
+INVENTORY_CACHE_SIZE = int(os.getenv("INVENTORY_CACHE_SIZE", "4096"))
+INVENTORY_CACHE_TTL = float(os.getenv("INVENTORY_CACHE_TTL", "30"))
+# Every worker LISTENs for the keys changed by the others, evicts them from its cache and
+# adds them to its key filter, retrying every CACHE_LISTENER_RETRY seconds if its connection drops
+CACHE_LISTENER = os.getenv("CACHE_LISTENER", "true").lower() in ("1", "true", "yes")
+CACHE_LISTENER_RETRY = float(os.getenv("CACHE_LISTENER_RETRY", "5"))
+# Bloom filter of the existing keys that turns lookups of unknown keys into 404s without a query.
+# It is sized for KEY_FILTER_CAPACITY keys (0 disables it) at KEY_FILTER_ERROR_RATE false
+# positives and rebuilt every KEY_FILTER_REBUILD_INTERVAL seconds; it needs CACHE_LISTENER.
+KEY_FILTER_CAPACITY = int(os.getenv("KEY_FILTER_CAPACITY", "100000"))
+KEY_FILTER_ERROR_RATE = float(os.getenv("KEY_FILTER_ERROR_RATE", "0.01"))
+KEY_FILTER_REBUILD_INTERVAL = float(os.getenv("KEY_FILTER_REBUILD_INTERVAL", "600"))
+
+# Maximum number of keys accepted by one batch lookup
+LOOKUP_MAX_KEYS = int(os.getenv("LOOKUP_MAX_KEYS", "500"))
+
+# Stock reservations: default and longest hold in seconds, and how often (0 disables it)
+# and in what batch size the background sweeper releases expired holds
+RESERVATION_TTL = float(os.getenv("RESERVATION_TTL", "600"))
+RESERVATION_MAX_TTL = float(os.getenv("RESERVATION_MAX_TTL", "3600"))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("RESERVATION_SWEEP_INTERVAL", "30"))
+RESERVATION_SWEEP_BATCH = int(os.getenv("RESERVATION_SWEEP_BATCH", "500"))
+
+# Opt-in coalescing of quantity adjustments: deltas for the same item are buffered for
+# ADJUST_COALESCE_INTERVAL milliseconds (0 disables it), or until ADJUST_COALESCE_MAX_PENDING
+# deltas are waiting, and committed together. Callers wait at most ADJUST_COALESCE_TIMEOUT seconds.
+ADJUST_COALESCE_INTERVAL = float(os.getenv("ADJUST_COALESCE_INTERVAL", "0"))
+ADJUST_COALESCE_MAX_PENDING = int(os.getenv("ADJUST_COALESCE_MAX_PENDING", "1000"))
+ADJUST_COALESCE_TIMEOUT = float(os.getenv("ADJUST_COALESCE_TIMEOUT", "5"))
+
+# Server-Sent Events: each subscriber may fall EVENTS_BUFFER_SIZE events behind before it is
+# disconnected, idle streams get a comment every EVENTS_KEEPALIVE seconds, and at most
+# EVENTS_MAX_SUBSCRIBERS streams are open at once (fewer if the gunicorn worker has fewer
+# threads to spare). The events are read from the change feed when a commit or a notification
+# from another worker (CACHE_LISTENER) comes in, and every EVENTS_POLL_INTERVAL seconds.
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", "256"))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))
+EVENTS_MAX_SUBSCRIBERS = int(os.getenv("EVENTS_MAX_SUBSCRIBERS", "100"))
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+
+# The outbox relay (flask outbox-relay) appends changes to OUTBOX_JSONL_PATH in batches of
+# OUTBOX_RELAY_BATCH, polling every OUTBOX_RELAY_INTERVAL seconds when it follows the outbox
+OUTBOX_JSONL_PATH = os.getenv("OUTBOX_JSONL_PATH", "outbox.jsonl")
+OUTBOX_RELAY_BATCH = int(os.getenv("OUTBOX_RELAY_BATCH", "500"))
+OUTBOX_RELAY_INTERVAL = float(os.getenv("OUTBOX_RELAY_INTERVAL", "1"))
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
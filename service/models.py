@@ -2,15 +2,21 @@
 Models for Inventory
 All of the models are stored in this module
 """
+import hashlib
 import logging
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
 
+from flask import abort
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import exc
+from sqlalchemy import column, delete, event, exc, func, literal_column, select, tuple_, update, values
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by, insert
+from sqlalchemy.orm import Session, make_transient_to_detached
 from requests import HTTPError  # pylint: disable=redefined-builtin
 from retry import retry
+from service.common.bloom import BloomFilter
+from service.common.cache import LRUCache
 
 logger = logging.getLogger("flask.app")
 # Create the SQLAlchemy object to be initialized later in init_db()
@@ -19,6 +25,64 @@ db = SQLAlchemy()
 RETRY_COUNT = int(os.environ.get("RETRY_COUNT", 10))
 RETRY_DELAY = int(os.environ.get("RETRY_DELAY", 1))
 RETRY_BACKOFF = int(os.environ.get("RETRY_BACKOFF", 2))
+# In-process cache of single Inventory lookups, sized from the app config in init_db()
+inventory_cache = LRUCache()
+# Bloom filter of the existing keys, so lookups of keys that were never created skip the database
+inventory_keys = BloomFilter()
+# Orders every write and delete for the change feed
+change_seq = db.Sequence("inventory_change_seq", metadata=db.metadata)
+
+
+def current_xid():
+    """Returns the ID of the writing transaction, which positions its changes in the feed"""
+    return db.cast(db.cast(func.pg_current_xact_id(), db.Text), db.BigInteger)  # pylint: disable=not-callable
+
+
+def snapshot_xmin():
+    """Returns the ID below which every transaction has finished, as of the statement's snapshot"""
+    return db.cast(
+        db.cast(func.pg_snapshot_xmin(func.pg_current_snapshot()), db.Text),  # pylint: disable=not-callable
+        db.BigInteger,
+    )
+
+
+# Channel that carries the "product_id:CONDITION" key of every committed change to the other workers
+INVALIDATION_CHANNEL = os.environ.get("INVALIDATION_CHANNEL", "inventory_cache")
+
+
+# Idempotent steps that bring tables created by an earlier release up to date, because
+# db.create_all() does not alter tables that already exist. Each (table, column, statements)
+# entry only runs when the column is missing, so a current schema takes no table locks.
+SCHEMA_UPGRADES = [
+    (
+        "inventory",
+        "version",
+        ["ALTER TABLE inventory ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1"],
+    ),
+    (
+        "inventory",
+        "change_seq",
+        [
+            "CREATE SEQUENCE IF NOT EXISTS inventory_change_seq",
+            # A volatile default gives every existing row its own position in the feed
+            "ALTER TABLE inventory ADD COLUMN IF NOT EXISTS change_seq BIGINT NOT NULL "
+            "DEFAULT nextval('inventory_change_seq')",
+        ],
+    ),
+] + [
+    (
+        table,
+        "change_xid",
+        [
+            # Existing rows sort before every later write, in their change_seq order
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0",
+            f"ALTER TABLE {table} ALTER COLUMN change_xid SET DEFAULT (pg_current_xact_id()::text::bigint)",
+            f"DROP INDEX IF EXISTS ix_{table}_change_seq",
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_change_position ON {table} (change_xid, change_seq)",
+        ],
+    )
+    for table in ("inventory", "inventory_tombstone")
+]
 
 
 # Function to initialize the database
@@ -52,6 +116,137 @@ class UpdateStatusType(Enum):
 
 
 # end enum UpdateStatusType
+class ReservationStatus(Enum):
+    """Enumeration of the states of a stock reservation"""
+
+    HELD = 1
+    COMMITTED = 2
+    CANCELLED = 3
+    EXPIRED = 4
+
+
+def cache_key(product_id, condition):
+    """Returns the (product_id, Condition) cache key of a lookup, or None if it has no valid key"""
+    try:
+        if not isinstance(condition, Condition):
+            condition = Condition[condition]
+        return int(product_id), condition
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+######################################################################
+#  C H A N G E   H O O K S
+######################################################################
+# Functions called with the list of changes of every committed transaction
+change_listeners = []
+
+
+def inventory_change(action: str, values_written: dict, previous_quantity: int = None) -> dict:
+    """Describes one write or delete of a Inventory for the change listeners
+    :param action: "created", "updated" or "deleted"
+    :param values_written: the column values as written, or the key and feed position of a delete
+    :param previous_quantity: the quantity before the write, if it is known
+    :rtype: dict
+    """
+    # Objects built by hand may still hold the enum names they were given
+    for name, enum in (("condition", Condition), ("can_update", UpdateStatusType)):
+        if isinstance(values_written.get(name), str):
+            values_written[name] = enum[values_written[name]]
+    return {
+        "action": action,
+        "key": (values_written["product_id"], values_written["condition"]),
+        "values": values_written,
+        "previous_quantity": previous_quantity,
+    }
+
+
+def restock_crossed(change: dict) -> bool:
+    """True if a write left the quantity below the restock level, when it was not before"""
+    if change["action"] == "deleted":
+        return False
+    written = change["values"]
+    previous = change["previous_quantity"]
+    restock_level = written["restock_level"]
+    return written["quantity"] < restock_level and (previous is None or previous >= restock_level)
+
+
+def notification(change: dict) -> str:
+    """Returns the "product_id:CONDITION" payload that tells the other workers about a change
+    A write that crossed the restock level adds ":previous_quantity", empty if it was a create
+    """
+    product_id, condition = change["key"]
+    payload = f"{product_id}:{condition.name}"
+    if restock_crossed(change):
+        previous = change["previous_quantity"]
+        payload += f":{'' if previous is None else previous}"
+    return payload
+
+
+def stage_changes(changes: list):
+    """Holds the changes of the current transaction until it commits or rolls back"""
+    for change in changes:
+        # Added before commit, so no reader can miss a key that exists
+        if change["action"] != "deleted":
+            inventory_keys.add(change["key"])
+    db.session.info.setdefault("inventory_changes", []).extend(changes)
+
+
+@event.listens_for(Session, "before_commit")
+def record_changes(session):
+    """Writes the changes of a transaction to the outbox with one INSERT before it commits
+    A second statement queues a notification of each change, which PostgreSQL only
+    delivers to the listening workers if the transaction commits
+    """
+    changes = session.info.get("inventory_changes")
+    if not changes:
+        return
+    session.execute(insert(InventoryOutbox.__table__).values([InventoryOutbox.entry(change) for change in changes]))
+    payloads = func.unnest(db.literal([notification(change) for change in changes], ARRAY(db.Text)))
+    session.execute(select(func.pg_notify(INVALIDATION_CHANNEL, payloads.column_valued("payload"))))  # pylint: disable=not-callable
+
+
+def invalidate_notified(payloads: list) -> dict:
+    """Drops the cached copies of the "product_id:CONDITION" keys another worker changed
+    The keys are also added to the key filter, since another worker may have created them
+    :return: the previous quantity of the keys whose writes crossed their restock level
+    :rtype: dict
+    """
+    restocks = {}
+    for payload in payloads:
+        product_id, _, condition = payload.partition(":")
+        condition, restocked, previous = condition.partition(":")
+        key = cache_key(product_id, condition)
+        if key is None:
+            continue
+        inventory_cache.invalidate(key)
+        inventory_keys.add(key)
+        if restocked:
+            restocks[key] = int(previous) if previous.isdigit() else None
+    return restocks
+
+
+@event.listens_for(Session, "after_commit")
+def publish_changes(session):
+    """Drops the cached copies of what a transaction changed and passes the changes on"""
+    changes = session.info.pop("inventory_changes", None)
+    if not changes:
+        return
+    for change in changes:
+        inventory_cache.invalidate(change["key"])
+    for listener in change_listeners:
+        try:
+            listener(changes)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.error("Change listener failed: %s", error)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_changes(session):
+    """Forgets the changes of a transaction that rolled back"""
+    session.info.pop("inventory_changes", None)
+
+
 class Inventory(db.Model):
     """
     Class that represents a Inventory
@@ -71,6 +266,49 @@ class Inventory(db.Model):
     can_update = db.Column(
         db.Enum(UpdateStatusType), default=UpdateStatusType.ENABLED.name
     )
+    # Bumped on every write and served as the ETag, so that a stale write can be refused
+    # without locking. Statements that bypass the ORM have to bump it themselves.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    # Position of the last write in the change feed: the writing transaction, then the order
+    # of the write. UPDATE statements set both on their own, but ON CONFLICT DO UPDATE has
+    # to set them explicitly.
+    change_xid = db.Column(
+        db.BigInteger, nullable=False, server_default=current_xid(), onupdate=current_xid()
+    )
+    change_seq = db.Column(
+        db.BigInteger,
+        nullable=False,
+        server_default=change_seq.next_value(),
+        onupdate=change_seq.next_value(),
+    )
+    __mapper_args__ = {"version_id_col": version}
+    __table_args__ = (
+        # Partial index holding only the rows that need to be restocked, so that
+        # find_by_restock() reads a small index instead of scanning the whole table
+        db.Index(
+            "ix_inventory_restock",
+            product_id,
+            condition,
+            postgresql_where=quantity < restock_level,
+        ),
+        # Partial indexes in restock priority order, so that find_restock_priority()
+        # reads the top K rows straight off an index instead of sorting the restock set
+        db.Index(
+            "ix_inventory_restock_deficit",
+            (restock_level - quantity).self_group().desc(),
+            product_id,
+            condition,
+            postgresql_where=quantity < restock_level,
+        ),
+        db.Index(
+            "ix_inventory_restock_ratio",
+            db.cast(quantity, db.Float) / restock_level,
+            product_id,
+            condition,
+            postgresql_where=quantity < restock_level,
+        ),
+        db.Index("ix_inventory_change_position", change_xid, change_seq),
+    )
 
     def __repr__(self):
         return (
@@ -91,7 +329,9 @@ class Inventory(db.Model):
         logger.info("Creating new inventory...")
         try:
             db.session.add(self)
-            return db.session.commit()
+            db.session.flush()
+            stage_changes([inventory_change("created", self.snapshot())])
+            db.session.commit()
         except exc.IntegrityError as error:
             db.session.rollback()
             logger.error(
@@ -122,6 +362,10 @@ class Inventory(db.Model):
             raise DataValidationError("Update called with empty ID field")
         if not self.condition:
             raise DataValidationError("Update called with empty Condition field")
+        history = db.inspect(self).attrs.quantity.history
+        previous_quantity = history.deleted[0] if history.deleted else None
+        db.session.flush()
+        stage_changes([inventory_change("updated", self.snapshot(), previous_quantity)])
         # Commit the changes
         db.session.commit()
 
@@ -140,7 +384,574 @@ class Inventory(db.Model):
             self.condition,
         )
         db.session.delete(self)
+        InventoryTombstone.record([(self.product_id, self.condition)])
+        db.session.commit()
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def create_bulk(cls, inventories: list) -> set:
+        """Creates a batch of Inventories with one INSERT and one commit
+        Rows whose (product_id, condition) key already exists are skipped
+        :param inventories: the deserialized Inventories to insert
+        :type inventories: list
+        :return: the (product_id, condition) keys that were inserted
+        :rtype: set
+        """
+        logger.info("Creating %d inventories in bulk...", len(inventories))
+        if not inventories:
+            return set()
+        stmt = (
+            insert(cls.__table__)
+            .values(
+                [
+                    {
+                        "product_id": inventory.product_id,
+                        "condition": inventory.condition,
+                        "quantity": inventory.quantity,
+                        "restock_level": inventory.restock_level,
+                        "can_update": inventory.can_update,
+                    }
+                    for inventory in inventories
+                ]
+            )
+            .on_conflict_do_nothing(index_elements=[cls.product_id, cls.condition])
+            .returning(*cls.__table__.columns)
+        )
+        try:
+            written = cls._written(db.session.execute(stmt).all(), "created")
+            db.session.commit()
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            logger.error("Inventory model create_bulk, an error occurred: %s", error)
+            raise
+        return {(inventory.product_id, inventory.condition) for inventory, _ in written}
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def upsert(cls, inventories: list) -> dict:
+        """Creates or updates a batch of Inventories with one INSERT ... ON CONFLICT DO UPDATE
+        Existing rows only take the new quantity and restock_level if their updates are enabled
+        :param inventories: the Inventories to write, with unique (product_id, condition) keys
+        :type inventories: list
+        :return: (Inventory, created) tuples for the rows that were written, by key
+        :rtype: dict
+        """
+        logger.info("Upserting %d inventories...", len(inventories))
+        if not inventories:
+            return {}
+        table = cls.__table__
+        stmt = insert(table).values(
+            [
+                {
+                    "product_id": inventory.product_id,
+                    "condition": inventory.condition,
+                    "quantity": inventory.quantity,
+                    "restock_level": inventory.restock_level,
+                    "can_update": inventory.can_update or UpdateStatusType.ENABLED,
+                }
+                for inventory in inventories
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.condition],
+            set_={
+                "quantity": stmt.excluded.quantity,
+                "restock_level": stmt.excluded.restock_level,
+                "last_updated_on": stmt.excluded.last_updated_on,
+                "version": table.c.version + 1,
+                "change_xid": current_xid(),
+                "change_seq": change_seq.next_value(),
+            },
+            where=table.c.can_update == UpdateStatusType.ENABLED,
+        ).returning(
+            *table.columns,
+            # xmax is only 0 for a freshly inserted row version
+            literal_column("xmax = 0").label("created"),
+            cls._previous_quantity(),
+        )
+        try:
+            written = cls._written(db.session.execute(stmt).all())
+            db.session.commit()
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            logger.error("Inventory model upsert, an error occurred: %s", error)
+            raise
+        return {
+            (inventory.product_id, inventory.condition): (inventory, extras["created"])
+            for inventory, extras in written
+        }
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def adjust_quantity(cls, product_id: int, condition: Condition, delta: int):
+        """Adds delta to the quantity of a Inventory with a single UPDATE ... RETURNING
+        The quantity only changes if updates are enabled and it stays non-negative
+        :param delta: the signed amount to add to the quantity
+        :type delta: int
+        :return: the updated Inventory, or None if no row was updated
+        :rtype: Inventory
+        """
+        logger.info(
+            "Adjusting inventory product_id=%s,condition=%s by %s",
+            product_id,
+            condition,
+            delta,
+        )
+        return cls._update_returning(
+            product_id,
+            condition,
+            {"quantity": cls.quantity + delta},
+            cls.can_update == UpdateStatusType.ENABLED,
+            cls.quantity + delta >= 0,
+            previous=(cls.quantity - delta).label("previous_quantity"),
+        )
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def adjust_quantities(cls, deltas: dict) -> dict:
+        """Adds a delta to the quantity of many Inventories with one UPDATE ... FROM VALUES ... RETURNING
+        Each quantity only changes if updates are enabled and it stays non-negative
+        :param deltas: the signed amount to add by (product_id, condition) key
+        :type deltas: dict
+        :return: the updated Inventories by (product_id, condition) key
+        :rtype: dict
+        """
+        logger.info("Adjusting %d inventories...", len(deltas))
+        if not deltas:
+            return {}
+        table = cls.__table__
+        changes = values(
+            column("product_id", db.Integer),
+            column("condition", db.String),
+            column("delta", db.Integer),
+            name="changes",
+        ).data([(product_id, condition.name, delta) for (product_id, condition), delta in deltas.items()])
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == changes.c.product_id,
+                table.c.condition == db.cast(changes.c.condition, table.c.condition.type),
+                table.c.can_update == UpdateStatusType.ENABLED,
+                table.c.quantity + changes.c.delta >= 0,
+            )
+            .values(quantity=table.c.quantity + changes.c.delta, version=table.c.version + 1)
+            .returning(*table.columns, (table.c.quantity - changes.c.delta).label("previous_quantity"))
+        )
+        try:
+            written = cls._written(db.session.execute(stmt).all())
+            db.session.commit()
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            logger.error("Inventory model adjust_quantities, an error occurred: %s", error)
+            raise
+        return {(inventory.product_id, inventory.condition): inventory for inventory, _ in written}
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def update_levels(
+        cls, product_id: int, condition: Condition, quantity: int, restock_level: int, versions: list = None
+    ):
+        """Sets the quantity and restock level of a Inventory with a single UPDATE ... RETURNING
+        Nothing changes unless updates of the Inventory are enabled
+        :param versions: if given, only update the Inventory if its version is one of these
+        :return: the updated Inventory, or None if no row was updated
+        :rtype: Inventory
+        """
+        logger.info(
+            "Updating inventory product_id=%s,condition=%s",
+            product_id,
+            condition,
+        )
+        return cls._update_returning(
+            product_id,
+            condition,
+            {"quantity": quantity, "restock_level": restock_level},
+            cls.can_update == UpdateStatusType.ENABLED,
+            *cls._version_criteria(versions),
+        )
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def update_levels_many(cls, inventories: list) -> dict:
+        """Sets the quantity and restock level of a batch of Inventories with one UPDATE ... FROM VALUES
+        Inventories whose updates are disabled are left alone
+        :param inventories: the new levels, with unique (product_id, condition) keys
+        :type inventories: list
+        :return: the updated Inventories by (product_id, condition) key
+        :rtype: dict
+        """
+        logger.info("Updating %d inventories...", len(inventories))
+        if not inventories:
+            return {}
+        table = cls.__table__
+        levels = values(
+            column("product_id", db.Integer),
+            column("condition", db.String),
+            column("quantity", db.Integer),
+            column("restock_level", db.Integer),
+            name="levels",
+        ).data(
+            [
+                (inventory.product_id, inventory.condition.name, inventory.quantity, inventory.restock_level)
+                for inventory in inventories
+            ]
+        )
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == levels.c.product_id,
+                table.c.condition == db.cast(levels.c.condition, table.c.condition.type),
+                table.c.can_update == UpdateStatusType.ENABLED,
+            )
+            .values(
+                quantity=levels.c.quantity,
+                restock_level=levels.c.restock_level,
+                version=table.c.version + 1,
+            )
+            .returning(*table.columns, cls._previous_quantity())
+        )
+        try:
+            written = cls._written(db.session.execute(stmt).all())
+            db.session.commit()
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            logger.error("Inventory model update_levels_many, an error occurred: %s", error)
+            raise
+        return {(inventory.product_id, inventory.condition): inventory for inventory, _ in written}
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def transfer(cls, product_id: int, source: Condition, target: Condition, quantity: int):
+        """Moves quantity copies of a product from one condition to another in one transaction
+        Both rows are locked in condition order so that concurrent transfers cannot deadlock,
+        and the target row is created if it does not exist yet
+        :return: the (source, target) Inventories after the move, or None if nothing was moved
+        :rtype: tuple
+        """
+        logger.info(
+            "Transferring %s of product_id=%s from %s to %s",
+            quantity,
+            product_id,
+            source,
+            target,
+        )
+        try:
+            rows = cls._lock_conditions(product_id, [source, target])
+            moving_from = rows.get(source)
+            if (
+                moving_from is None
+                or moving_from.can_update != UpdateStatusType.ENABLED
+                or moving_from.quantity < quantity
+            ):
+                db.session.rollback()
+                return None
+            moving_to = rows.get(target)
+            created = moving_to is None
+            if created:
+                db.session.execute(
+                    insert(cls.__table__)
+                    .values(
+                        product_id=product_id,
+                        condition=target,
+                        quantity=0,
+                        restock_level=moving_from.restock_level,
+                        can_update=UpdateStatusType.ENABLED,
+                    )
+                    .on_conflict_do_nothing()
+                )
+                moving_to = cls._lock_conditions(product_id, [target])[target]
+            if moving_to.can_update != UpdateStatusType.ENABLED:
+                db.session.rollback()
+                return None
+            previous = (moving_from.quantity, None if created else moving_to.quantity)
+            moving_from.quantity -= quantity
+            moving_to.quantity += quantity
+            db.session.flush()
+            stage_changes(
+                [
+                    inventory_change("updated", moving_from.snapshot(), previous[0]),
+                    inventory_change("created" if created else "updated", moving_to.snapshot(), previous[1]),
+                ]
+            )
+            db.session.commit()
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            logger.error("Inventory model transfer, an error occurred: %s", error)
+            raise
+        return moving_from, moving_to
+
+    @classmethod
+    def _lock_conditions(cls, product_id: int, conditions: list) -> dict:
+        """Locks the rows of a product in the given conditions with SELECT ... FOR UPDATE
+        :return: the locked Inventories by condition
+        :rtype: dict
+        """
+        stmt = (
+            select(cls)
+            .where(cls.product_id == product_id, cls.condition.in_(conditions))
+            .order_by(cls.condition)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        return {inventory.condition: inventory for inventory in db.session.execute(stmt).scalars()}
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def set_update_status(
+        cls, product_id: int, condition: Condition, can_update: UpdateStatusType, versions: list = None
+    ):
+        """Enables or disables updates of a Inventory with a single UPDATE ... RETURNING
+        :param versions: if given, only update the Inventory if its version is one of these
+        :return: the updated Inventory, or None if no row was updated
+        :rtype: Inventory
+        """
+        logger.info(
+            "Setting can_update of inventory product_id=%s,condition=%s to %s",
+            product_id,
+            condition,
+            can_update,
+        )
+        return cls._update_returning(
+            product_id, condition, {"can_update": can_update}, *cls._version_criteria(versions)
+        )
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def set_update_status_many(
+        cls,
+        can_update: UpdateStatusType,
+        condition: Condition = None,
+        product_ids: tuple = None,
+        keys: list = None,
+    ) -> int:
+        """Enables or disables updates of every Inventory matching a filter with one UPDATE
+        Rows that already have the requested status are left alone
+        :param condition: only change Inventories in this condition
+        :param product_ids: only change Inventories whose product ID is in this (low, high) range
+        :param keys: only change Inventories with these (product_id, condition) keys
+        :return: the number of Inventories changed
+        :rtype: int
+        """
+        logger.info("Setting can_update of many inventories to %s", can_update)
+        criteria = [cls.can_update != can_update]
+        if condition is not None:
+            criteria.append(cls.condition == condition)
+        if product_ids is not None:
+            criteria.append(cls.product_id.between(*product_ids))
+        if keys is not None:
+            criteria.append(tuple_(cls.product_id, cls.condition).in_(keys))
+        stmt = (
+            update(cls.__table__)
+            .where(*criteria)
+            .values(can_update=can_update, version=cls.version + 1)
+            .returning(*cls.__table__.columns, cls.quantity.label("previous_quantity"))
+        )
+        written = cls._written(db.session.execute(stmt).all())
         db.session.commit()
+        return len(written)
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def delete_by_key(cls, product_id: int, condition: Condition) -> bool:
+        """Removes a Inventory with a single DELETE ... RETURNING
+        :return: True if a row was deleted, False if it was not found
+        :rtype: bool
+        """
+        logger.info(
+            "Deleting inventory product_id=%s,condition=%s",
+            product_id,
+            condition,
+        )
+        table = cls.__table__
+        deleted = (
+            delete(table)
+            .where(table.c.product_id == product_id, table.c.condition == condition)
+            .returning(table.c.product_id, table.c.condition)
+            .cte("deleted")
+        )
+        # The tombstone is written by the same statement as the delete
+        stmt = InventoryTombstone.record_from(deleted)
+        rows = InventoryTombstone.deleted(db.session.execute(stmt).all())
+        db.session.commit()
+        return bool(rows)
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def find_changes(cls, since: tuple, limit: int) -> list:
+        """Returns the writes and deletes after a position in the change feed, in feed order
+        A position is the (change_xid, change_seq) of a change. Only the changes of transactions
+        below the snapshot's xmin are served: every one of those has finished, and any change
+        that commits later has a higher change_xid, so a consumer's cursor never moves past a
+        change that is still being committed.
+        :param since: the position the consumer has already seen, (0, 0) to start at the beginning
+        :param limit: the maximum number of changes to return
+        :return: (position, Inventory or None, (product_id, condition)) tuples; None marks a delete
+        :rtype: list
+        """
+        logger.info("Processing change feed query after %s ...", since)
+        # Both reads see at least what had finished when the xmin was taken
+        xmin = db.session.execute(select(snapshot_xmin())).scalar_one()
+        changes = []
+        for model in (cls, InventoryTombstone):
+            position = db.tuple_(model.change_xid, model.change_seq)
+            rows = (
+                model.query.filter(position > db.tuple_(*since), model.change_xid < xmin)
+                .order_by(model.change_xid, model.change_seq)
+                .limit(limit)
+                .all()
+            )
+            changes += [
+                (
+                    (item.change_xid, item.change_seq),
+                    item if model is cls else None,
+                    (item.product_id, item.condition),
+                )
+                for item in rows
+            ]
+        changes.sort(key=lambda change: change[0])
+        return changes[:limit]
+
+    @staticmethod
+    def feed_head() -> tuple:
+        """Returns a position to follow the change feed from without reading what is already in it
+        The changes of transactions below the snapshot's xmin are before it, and everything
+        that is still being committed comes after it
+        """
+        return db.session.execute(select(snapshot_xmin())).scalar_one(), 0
+
+    @classmethod
+    def _version_criteria(cls, versions: list) -> list:
+        """Returns the conditions that restrict a write to the given versions, if there are any"""
+        return [] if versions is None else [cls.version.in_(versions)]
+
+    @classmethod
+    def _update_returning(cls, product_id, condition, values: dict, *criteria, previous=None):
+        """Updates one Inventory by key with a single UPDATE ... RETURNING and commits
+        :param values: the new column values
+        :param criteria: extra conditions the row has to meet to be updated
+        :param previous: the RETURNING column of the quantity before the update, if the
+            statement can work it out better than _previous_quantity()
+        :return: the updated Inventory, or None if no row was updated
+        :rtype: Inventory
+        """
+        stmt = (
+            update(cls.__table__)
+            .where(cls.product_id == product_id, cls.condition == condition, *criteria)
+            .values(version=cls.version + 1, **values)
+            .returning(*cls.__table__.columns, previous if previous is not None else cls._previous_quantity())
+        )
+        written = cls._written(db.session.execute(stmt).all())
+        db.session.commit()
+        return written[0][0] if written else None
+
+    @classmethod
+    def _previous_quantity(cls):
+        """Returns a RETURNING column with the quantity a row had before the statement
+        A subquery in RETURNING reads the snapshot the statement started with, so it sees the
+        old row (or nothing, for a row the statement inserted). If another transaction commits a
+        write to the row while the statement waits for its lock, that write is missed, so writes
+        that add a delta return the new quantity minus the delta instead.
+        """
+        table = cls.__table__
+        previous = table.alias("previous")
+        # RETURNING of an INSERT does not correlate, so name the target row's columns directly
+        target = [literal_column(f"{table.name}.{name}") for name in ("product_id", "condition")]
+        return (
+            select(previous.c.quantity)
+            .where(previous.c.product_id == target[0], previous.c.condition == target[1])
+            .scalar_subquery()
+            .label("previous_quantity")
+        )
+
+    @classmethod
+    def _written(cls, rows: list, action: str = "updated") -> list:
+        """Turns the RETURNING rows of a write into Inventories and stages their changes
+        A row with a true "created" value is staged as created whatever the action
+        :return: (Inventory, extras) tuples, where extras holds the values that are not columns
+        :rtype: list
+        """
+        columns = cls.__table__.columns.keys()
+        written = []
+        changes = []
+        for row in rows:
+            mapping = dict(row._mapping)
+            extras = {name: mapping.pop(name) for name in list(mapping) if name not in columns}
+            changes.append(
+                inventory_change(
+                    "created" if extras.get("created") else action,
+                    mapping,
+                    extras.get("previous_quantity"),
+                )
+            )
+            written.append((cls(**mapping), extras))
+        stage_changes(changes)
+        return written
 
     def serialize(self):
         """Serializes a Inventory into a dictionary"""
@@ -151,13 +962,26 @@ class Inventory(db.Model):
             "restock_level": self.restock_level,
             "last_updated_on": self.last_updated_on,
             "can_update": self.can_update.name,
+            "version": self.version,
         }
 
-    def deserialize(self, data: dict):
+    def snapshot(self) -> dict:
+        """Returns the column values of a Inventory for caching"""
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns}
+
+    @classmethod
+    def from_snapshot(cls, values: dict):
+        """Attaches a cached Inventory to the session without querying the database"""
+        inventory = cls(**values)
+        make_transient_to_detached(inventory)
+        return db.session.merge(inventory, load=False)
+
+    def deserialize(self, data: dict, min_quantity: int = 1):
         """
         Deserializes a Inventory from a dictionary
         Args:
             data (dict): A dictionary containing the resource data
+            min_quantity (int): The smallest quantity that is accepted
         """
         try:
             self.product_id = data["product_id"]
@@ -172,7 +996,7 @@ class Inventory(db.Model):
                 raise DataValidationError(
                     "Invalid can_update attribute type: %s", data["can_update"]
                 )
-            if isinstance(data["quantity"], int) and data["quantity"] >= 1:
+            if isinstance(data["quantity"], int) and data["quantity"] >= min_quantity:
                 self.quantity = data["quantity"]
             else:
                 raise DataValidationError(
@@ -204,10 +1028,31 @@ class Inventory(db.Model):
         """Initializes the database session"""
         logger.info("Initializing database")
         cls.app = app
+        inventory_cache.configure(
+            app.config.get("INVENTORY_CACHE_SIZE", 0),
+            app.config.get("INVENTORY_CACHE_TTL", 0),
+        )
+        inventory_keys.configure(
+            app.config.get("KEY_FILTER_CAPACITY", 0),
+            app.config.get("KEY_FILTER_ERROR_RATE", 0.01),
+        )
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
         app.app_context().push()
         db.create_all()  # make our sqlalchemy tables
+        cls.upgrade_schema()
+
+    @classmethod
+    def upgrade_schema(cls):
+        """Adds the columns of SCHEMA_UPGRADES that an existing database is missing"""
+        with db.engine.begin() as connection:
+            inspector = db.inspect(connection)
+            for table, column_name, statements in SCHEMA_UPGRADES:
+                if column_name in {column["name"] for column in inspector.get_columns(table)}:
+                    continue
+                logger.info("Adding column %s.%s", table, column_name)
+                for statement in statements:
+                    connection.execute(db.text(statement))
 
     @classmethod
     @retry(
@@ -222,6 +1067,112 @@ class Inventory(db.Model):
         logger.info("Processing all Inventories")
         return cls.query.all()
 
+    @classmethod
+    def find_page(cls, query, limit: int, after: tuple = None):
+        """Returns one page of a query using keyset pagination on the primary key
+        :param query: the query to page through
+        :param limit: the maximum number of rows to return
+        :type limit: int
+        :param after: the (product_id, condition) key of the last row of the previous page
+        :type after: tuple
+        :return: a query for up to limit Inventories ordered by product_id and condition
+        """
+        logger.info("Processing page of %d after %s ...", limit, after)
+        if after is not None:
+            query = query.filter(tuple_(cls.product_id, cls.condition) > after)
+        return query.order_by(cls.product_id, cls.condition).limit(limit)
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def collection_meta(cls, query) -> tuple:
+        """Returns the row count, latest last_updated_on and key digest of a query in one aggregate statement
+        :param query: the query to summarize
+        :return: a (count, last_updated_on, keys) tuple, where keys is the key_digest of the rows
+        :rtype: tuple
+        """
+        logger.info("Processing collection metadata ...")
+        rows = query.subquery()
+        # pylint: disable=not-callable
+        keys = func.string_agg(
+            func.concat(rows.c.product_id, ":", rows.c.condition),
+            aggregate_order_by(",", rows.c.product_id, rows.c.condition),
+        )
+        stmt = select(func.count(), func.max(rows.c.last_updated_on), func.md5(keys))
+        return tuple(db.session.execute(stmt).one())
+
+    @staticmethod
+    def key_digest(inventories: list) -> str:
+        """Returns the digest of the keys of some Inventories that collection_meta computes in SQL
+        :return: the MD5 of the "product_id:CONDITION" keys in key order, or None if there are none
+        :rtype: str
+        """
+        if not inventories:
+            return None
+        ordered = sorted(inventories, key=lambda item: (item.product_id, item.condition.value))
+        keys = ",".join(f"{item.product_id}:{item.condition.name}" for item in ordered)
+        return hashlib.md5(keys.encode()).hexdigest()
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def summarize(cls, query) -> list:
+        """Returns totals per condition for a query, computed in one GROUP BY statement
+        :param query: the query to summarize
+        :return: one dictionary per condition with its count, total quantity,
+            restock-needed count and disabled count
+        :rtype: list
+        """
+        logger.info("Processing inventory summary ...")
+        rows = query.subquery()
+        # pylint: disable=not-callable
+        stmt = (
+            select(
+                rows.c.condition,
+                func.count(),
+                func.coalesce(func.sum(rows.c.quantity), 0),
+                func.count().filter(rows.c.quantity < rows.c.restock_level),
+                func.count().filter(rows.c.can_update == UpdateStatusType.DISABLED),
+            )
+            .group_by(rows.c.condition)
+            .order_by(rows.c.condition)
+        )
+        return [
+            {
+                "condition": condition.name,
+                "count": count,
+                "total_quantity": total_quantity,
+                "restock_needed": restock_needed,
+                "disabled": disabled,
+            }
+            for condition, count, total_quantity, restock_needed, disabled in db.session.execute(stmt).all()
+        ]
+
+    @classmethod
+    def stream_all(cls, chunk_size: int):
+        """Yields all of the Inventories, fetching them in chunks from a server-side cursor
+        :param chunk_size: the number of rows fetched from the cursor at a time
+        :type chunk_size: int
+        :return: a generator of Inventories ordered by product_id and condition
+        """
+        logger.info("Streaming all Inventories in chunks of %d", chunk_size)
+        stmt = (
+            select(cls)
+            .order_by(cls.product_id, cls.condition)
+            .execution_options(yield_per=chunk_size)
+        )
+        yield from db.session.execute(stmt).scalars()
+
     @classmethod
     @retry(
         HTTPError,
@@ -231,15 +1182,78 @@ class Inventory(db.Model):
         logger=logger,
     )
     def find(cls, by_id, by_condition):
-        """Finds a Inventory by it's ID and condition"""
+        """Finds a Inventory by it's ID and condition
+        Lookups are served from the in-process cache when possible
+        """
         logger.info(
             "Processing lookup for product_id %s and condition %s ...",
             by_id,
             by_condition,
         )
-        return cls.query.filter(
+        key = cache_key(by_id, by_condition)
+        cached = inventory_cache.get(key) if key else None
+        if cached is not None:
+            return cls.from_snapshot(cached)
+        if key is not None and key not in inventory_keys:
+            return None
+        inventory = cls.query.filter(
             cls.product_id == by_id, cls.condition == by_condition
         ).first()
+        if inventory is not None:
+            inventory_cache.set(key, inventory.snapshot())
+        elif key is not None:
+            inventory_keys.false_positive()
+        return inventory
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def find_many(cls, keys: list) -> dict:
+        """Finds many Inventories by their (product_id, condition) keys
+        Keys in the in-process cache are served from it and the rest are
+        fetched with a single WHERE (product_id, condition) IN (...) query
+        :param keys: the (product_id, Condition) keys to look up
+        :type keys: list
+        :return: the Inventories that were found, by key
+        :rtype: dict
+        """
+        logger.info("Processing lookup for %d keys ...", len(keys))
+        found = {}
+        misses = []
+        for key in keys:
+            cached = inventory_cache.get(key)
+            if cached is not None:
+                found[key] = cls.from_snapshot(cached)
+            elif key in inventory_keys:
+                misses.append(key)
+        if misses:
+            query = cls.query.filter(tuple_(cls.product_id, cls.condition).in_(misses))
+            for inventory in query.all():
+                key = (inventory.product_id, inventory.condition)
+                inventory_cache.set(key, inventory.snapshot())
+                found[key] = inventory
+            inventory_keys.false_positive(len(set(misses) - found.keys()))
+        return found
+
+    @classmethod
+    def rebuild_key_filter(cls, chunk_size: int) -> bool:
+        """Rebuilds the filter of existing keys from a scan of the keys
+        Deleted keys stay in the filter until it is rebuilt
+        :param chunk_size: the number of keys fetched from the cursor at a time
+        :return: False if the filter is disabled or already being rebuilt
+        :rtype: bool
+        """
+        logger.info("Rebuilding the inventory key filter ...")
+        count = db.session.execute(select(func.count()).select_from(cls.__table__)).scalar()  # pylint: disable=not-callable
+        rows = db.session.execute(
+            select(cls.product_id, cls.condition).execution_options(yield_per=chunk_size)
+        )
+        return inventory_keys.rebuild(((row.product_id, row.condition) for row in rows), count)
 
     @classmethod
     @retry(
@@ -261,7 +1275,10 @@ class Inventory(db.Model):
             product_id,
             condition,
         )
-        return cls.query.get_or_404((product_id, condition))
+        inventory = cls.find(product_id, condition)
+        if inventory is None:
+            abort(404)
+        return inventory
 
     @classmethod
     @retry(
@@ -281,6 +1298,25 @@ class Inventory(db.Model):
         logger.info("Processing condition query for %s ...", condition.name)
         return cls.query.filter(cls.condition == condition)
 
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def find_by_product(cls, product_id: int) -> list:
+        """Returns every condition of a product
+        The lookup uses the product_id prefix of the primary key index
+        :param product_id: the id of the product
+        :type product_id: int
+        :return: the Inventories of the product ordered by condition
+        :rtype: list
+        """
+        logger.info("Processing product query for %s ...", product_id)
+        return cls.query.filter(cls.product_id == product_id).order_by(cls.condition).all()
+
     @classmethod
     @retry(
         HTTPError,
@@ -296,4 +1332,428 @@ class Inventory(db.Model):
         :rtype: list
         """
         logger.info("Returning items that need to be restocked")
+        # The filter must match the predicate of ix_inventory_restock for the index to be used
         return cls.query.filter(cls.quantity < cls.restock_level)
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def find_restock_priority(cls, top: int = None, order: str = "deficit"):
+        """Returns the items that need to be restocked, most depleted first
+        :param top: the maximum number of items to return, or None for all of them
+        :type top: int
+        :param order: 'deficit' for restock_level - quantity, 'ratio' for quantity / restock_level
+        :type order: str
+        :return: a query for the items in restock priority order
+        """
+        logger.info("Returning top %s items to restock by %s", top, order)
+        if order == "ratio":
+            priority = db.cast(cls.quantity, db.Float) / cls.restock_level
+        else:
+            priority = (cls.restock_level - cls.quantity).desc()
+        query = cls.find_by_restock().order_by(priority, cls.product_id, cls.condition)
+        return query.limit(top) if top else query
+
+
+@event.listens_for(Inventory, "before_insert")
+def add_inserted_key(mapper, connection, target):  # pylint: disable=unused-argument
+    """Adds the key of every Inventory inserted through the ORM to the key filter"""
+    inventory_keys.add(cache_key(target.product_id, target.condition))
+
+
+class InventoryTombstone(db.Model):
+    """
+    Class that records the deletion of a Inventory for the change feed
+    There is one tombstone per key, moved forward in the feed each time the key is deleted
+    """
+
+    __tablename__ = "inventory_tombstone"
+    product_id = db.Column(db.Integer, primary_key=True)
+    condition = db.Column(db.Enum(Condition), primary_key=True)
+    change_xid = db.Column(db.BigInteger, nullable=False, server_default=current_xid())
+    change_seq = db.Column(db.BigInteger, nullable=False)
+    deleted_on = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (db.Index("ix_inventory_tombstone_change_position", change_xid, change_seq),)
+
+    @classmethod
+    def record(cls, keys: list):
+        """Records the deletion of the given (product_id, condition) keys, without committing"""
+        if not keys:
+            return
+        stmt = insert(cls.__table__).values(
+            [
+                {
+                    "product_id": product_id,
+                    "condition": condition,
+                    "change_xid": current_xid(),
+                    "change_seq": change_seq.next_value(),
+                    "deleted_on": datetime.now(),
+                }
+                for product_id, condition in keys
+            ]
+        )
+        cls.deleted(db.session.execute(cls._returning(cls._upsert(stmt))).all())
+
+    @classmethod
+    def record_from(cls, deleted):
+        """Returns an INSERT that records the deletion of the keys returned by a DELETE ... RETURNING CTE"""
+        stmt = insert(cls.__table__).from_select(
+            ["product_id", "condition", "change_xid", "change_seq", "deleted_on"],
+            select(
+                deleted.c.product_id,
+                deleted.c.condition,
+                current_xid(),
+                change_seq.next_value(),
+                db.literal(datetime.now(), db.DateTime),
+            ),
+        )
+        return cls._returning(cls._upsert(stmt))
+
+    @classmethod
+    def _returning(cls, stmt):
+        """Returns the key and feed position of each tombstone an INSERT writes"""
+        return stmt.returning(cls.product_id, cls.condition, cls.change_xid, cls.change_seq)
+
+    @classmethod
+    def deleted(cls, rows: list) -> list:
+        """Stages the deletes recorded by the RETURNING rows of a tombstone INSERT"""
+        stage_changes([inventory_change("deleted", dict(row._mapping)) for row in rows])
+        return rows
+
+    @classmethod
+    def _upsert(cls, stmt):
+        """Moves an existing tombstone forward instead of failing on its key"""
+        table = cls.__table__
+        return stmt.on_conflict_do_update(
+            index_elements=[table.c.product_id, table.c.condition],
+            set_={
+                "change_xid": stmt.excluded.change_xid,
+                "change_seq": stmt.excluded.change_seq,
+                "deleted_on": stmt.excluded.deleted_on,
+            },
+        )
+
+
+class InventoryOutbox(db.Model):
+    """
+    Class that holds the Inventory changes waiting to be published to other systems
+    Entries are written by the transaction that made the change and removed by the relay
+    once its sink has taken them, so every committed change is delivered at least once
+    """
+
+    __tablename__ = "inventory_outbox"
+    id = db.Column(db.BigInteger, db.Identity(), primary_key=True)
+    change_seq = db.Column(db.BigInteger, nullable=False)
+    action = db.Column(db.String(16), nullable=False)
+    product_id = db.Column(db.Integer, nullable=False)
+    condition = db.Column(db.Enum(Condition), nullable=False)
+    previous_quantity = db.Column(db.Integer, nullable=True)
+    inventory = db.Column(db.JSON, nullable=True)
+    created_on = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+    def serialize(self):
+        """Serializes a InventoryOutbox entry into a dictionary"""
+        return {
+            "id": self.id,
+            "change_seq": self.change_seq,
+            "action": self.action,
+            "product_id": self.product_id,
+            "condition": self.condition.name,
+            "previous_quantity": self.previous_quantity,
+            "inventory": self.inventory,
+            "created_on": self.created_on.isoformat(),
+        }
+
+    @classmethod
+    def entry(cls, change: dict) -> dict:
+        """Returns the outbox row of a staged change"""
+        written = change["values"]
+        inventory = None
+        if change["action"] != "deleted":
+            inventory = Inventory(**written).serialize()
+            inventory["last_updated_on"] = inventory["last_updated_on"].isoformat()
+        return {
+            "change_seq": written["change_seq"],
+            "action": change["action"],
+            "product_id": written["product_id"],
+            "condition": written["condition"],
+            "previous_quantity": change["previous_quantity"],
+            "inventory": inventory,
+            "created_on": datetime.now(),
+        }
+
+    @classmethod
+    def drain(cls, sink, batch_size: int = 500) -> int:
+        """Hands the outbox to a sink in id order, one batch per transaction
+        A batch is only removed once the sink has returned, so a failed sink leaves it for the
+        next run. Entries are claimed with FOR UPDATE SKIP LOCKED, so several relays never wait
+        on each other, but only a single relay keeps the batches in order.
+        :param sink: called with a list of serialized entries
+        :param batch_size: the number of entries handed over per call
+        :return: the number of entries relayed
+        :rtype: int
+        """
+        relayed = 0
+        while True:
+            claimed = select(cls).order_by(cls.id).limit(batch_size).with_for_update(skip_locked=True)
+            try:
+                entries = db.session.execute(claimed).scalars().all()
+                if entries:
+                    sink([entry.serialize() for entry in entries])
+                    db.session.execute(delete(cls.__table__).where(cls.id.in_([entry.id for entry in entries])))
+                db.session.commit()
+            except Exception as error:
+                db.session.rollback()
+                logger.error("InventoryOutbox model drain, an error occurred: %s", error)
+                raise
+            relayed += len(entries)
+            if len(entries) < batch_size:
+                break
+        if relayed:
+            logger.info("Relayed %d outbox entries", relayed)
+        return relayed
+
+
+class Reservation(db.Model):
+    """
+    Class that represents a hold on some copies of a Inventory
+    The held copies are taken out of the Inventory quantity when the hold is placed and
+    are put back if it is cancelled or expires
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    condition = db.Column(db.Enum(Condition), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    status = db.Column(
+        db.Enum(ReservationStatus), nullable=False, default=ReservationStatus.HELD
+    )
+    created_on = db.Column(db.DateTime, default=datetime.now)
+    expires_on = db.Column(db.DateTime, nullable=False)
+    __table_args__ = (
+        db.ForeignKeyConstraint(
+            [product_id, condition],
+            [Inventory.product_id, Inventory.condition],
+            ondelete="CASCADE",
+        ),
+        # Partial index of the holds that can still expire, read by the sweeper in expiry order
+        db.Index(
+            "ix_reservation_expiry",
+            expires_on,
+            postgresql_where=status == ReservationStatus.HELD,
+        ),
+    )
+
+    def __repr__(self):
+        return f"<Reservation id=[{self.id}] product_id=[{self.product_id}] condition=[{self.condition}]>"
+
+    def serialize(self):
+        """Serializes a Reservation into a dictionary"""
+        return {
+            "id": self.id,
+            "product_id": self.product_id,
+            "condition": self.condition.name,
+            "quantity": self.quantity,
+            "status": self.status.name,
+            "created_on": self.created_on,
+            "expires_on": self.expires_on,
+        }
+
+    ##################################################
+    # CLASS METHODS
+    ##################################################
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def hold(cls, product_id: int, condition: Condition, quantity: int, ttl: float):
+        """Holds quantity copies of a Inventory for ttl seconds
+        The copies are taken with a conditional decrement, so concurrent holds never oversell
+        and the Inventory row is only locked for the length of this short transaction
+        :return: the new Reservation, or None if the copies could not be held
+        :rtype: Reservation
+        """
+        logger.info(
+            "Holding %s of inventory product_id=%s,condition=%s",
+            quantity,
+            product_id,
+            condition,
+        )
+        table = Inventory.__table__
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == product_id,
+                table.c.condition == condition,
+                table.c.can_update == UpdateStatusType.ENABLED,
+                table.c.quantity >= quantity,
+            )
+            .values(quantity=table.c.quantity - quantity, version=table.c.version + 1)
+            .returning(*table.columns, (table.c.quantity + quantity).label("previous_quantity"))
+        )
+        try:
+            if not Inventory._written(db.session.execute(stmt).all()):
+                db.session.rollback()
+                return None
+            now = datetime.now()
+            reservation = cls(
+                product_id=product_id,
+                condition=condition,
+                quantity=quantity,
+                status=ReservationStatus.HELD,
+                created_on=now,
+                expires_on=now + timedelta(seconds=ttl),
+            )
+            db.session.add(reservation)
+            db.session.commit()
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            logger.error("Reservation model hold, an error occurred: %s", error)
+            raise
+        return reservation
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def commit_hold(cls, reservation_id: int):
+        """Turns a held Reservation that has not expired into a committed one
+        :return: the committed Reservation, or None if it is not held or has expired
+        :rtype: Reservation
+        """
+        logger.info("Committing reservation %s", reservation_id)
+        stmt = (
+            update(cls.__table__)
+            .where(
+                cls.id == reservation_id,
+                cls.status == ReservationStatus.HELD,
+                cls.expires_on > datetime.now(),
+            )
+            .values(status=ReservationStatus.COMMITTED)
+            .returning(*cls.__table__.columns)
+        )
+        row = db.session.execute(stmt).one_or_none()
+        db.session.commit()
+        return cls(**row._mapping) if row else None
+
+    @classmethod
+    @retry(
+        HTTPError,
+        delay=RETRY_DELAY,
+        backoff=RETRY_BACKOFF,
+        tries=RETRY_COUNT,
+        logger=logger,
+    )
+    def cancel(cls, reservation_id: int):
+        """Cancels a held Reservation and puts its copies back into the Inventory
+        :return: the cancelled Reservation, or None if it is not held
+        :rtype: Reservation
+        """
+        logger.info("Cancelling reservation %s", reservation_id)
+        stmt = (
+            update(cls.__table__)
+            .where(cls.id == reservation_id, cls.status == ReservationStatus.HELD)
+            .values(status=ReservationStatus.CANCELLED)
+            .returning(*cls.__table__.columns)
+        )
+        try:
+            row = db.session.execute(stmt).one_or_none()
+            if row is not None:
+                cls._release({(row.product_id, row.condition): row.quantity})
+            db.session.commit()
+        except exc.SQLAlchemyError as error:
+            db.session.rollback()
+            logger.error("Reservation model cancel, an error occurred: %s", error)
+            raise
+        return cls(**row._mapping) if row else None
+
+    @classmethod
+    def release_expired(cls, batch_size: int = 500) -> int:
+        """Expires the holds that have run out and puts their copies back, one batch per transaction
+        Holds are claimed with FOR UPDATE SKIP LOCKED, so several sweepers never wait on each other
+        :param batch_size: the number of holds released per transaction
+        :return: the number of holds released
+        :rtype: int
+        """
+        released = 0
+        while True:
+            expired = (
+                select(cls.id)
+                .where(cls.status == ReservationStatus.HELD, cls.expires_on <= datetime.now())
+                .order_by(cls.expires_on)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+                .cte("expired")
+            )
+            stmt = (
+                update(cls.__table__)
+                .where(cls.id == expired.c.id)
+                .values(status=ReservationStatus.EXPIRED)
+                .returning(cls.product_id, cls.condition, cls.quantity)
+            )
+            try:
+                rows = db.session.execute(stmt).all()
+                amounts = {}
+                for row in rows:
+                    key = (row.product_id, row.condition)
+                    amounts[key] = amounts.get(key, 0) + row.quantity
+                cls._release(amounts)
+                db.session.commit()
+            except exc.SQLAlchemyError as error:
+                db.session.rollback()
+                logger.error("Reservation model release_expired, an error occurred: %s", error)
+                raise
+            released += len(rows)
+            if len(rows) < batch_size:
+                break
+        if released:
+            logger.info("Released %d expired reservations", released)
+        return released
+
+    @classmethod
+    def _release(cls, amounts: dict):
+        """Adds held copies back to their Inventories with one UPDATE ... FROM VALUES, without committing
+        Copies are put back even if updates of the Inventory have been disabled since
+        :param amounts: the number of copies to put back by (product_id, condition) key
+        """
+        if not amounts:
+            return
+        table = Inventory.__table__
+        released = values(
+            column("product_id", db.Integer),
+            column("condition", db.String),
+            column("quantity", db.Integer),
+            name="released",
+        ).data(
+            [(product_id, condition.name, quantity) for (product_id, condition), quantity in amounts.items()]
+        )
+        stmt = (
+            update(table)
+            .where(
+                table.c.product_id == released.c.product_id,
+                table.c.condition == db.cast(released.c.condition, table.c.condition.type),
+            )
+            .values(quantity=table.c.quantity + released.c.quantity, version=table.c.version + 1)
+            .returning(*table.columns, (table.c.quantity - released.c.quantity).label("previous_quantity"))
+        )
+        Inventory._written(db.session.execute(stmt).all())
+
+    @classmethod
+    def find(cls, reservation_id: int):
+        """Finds a Reservation by its id"""
+        logger.info("Processing lookup for reservation %s ...", reservation_id)
+        return db.session.get(cls, reservation_id)
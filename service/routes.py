@@ -19,21 +19,70 @@ Inventory Store Service with Swagger
 Paths:
 ------
 GET / - Displays a UI for Selenium testing
-GET /inventory - Returns a list all of the Inventories
+GET /metrics - Returns the counters of the inventory cache, its listener, the key filter and the event stream
+GET /inventory - Returns a list all of the Inventories (NDJSON stream with ?stream=1 or Accept: application/x-ndjson)
+GET /inventory/{list_filter} - Returns the Inventories that are NEW, OPEN_BOX, USED or need a RESTOCK
+    Both list endpoints page through results with ?limit=N&cursor=C and a Link: rel="next" header
+POST /inventory/lookup - Returns the Inventories for a list of (product_id, condition) keys in one query
+GET /inventory/summary - Returns counts and quantities per condition (?filter= takes a list filter)
+GET /inventory/RESTOCK?top=K&order=deficit|ratio - Returns the K items furthest below their restock level
+GET /inventory/{product_id} - Returns every condition of a product with the total quantity
 GET /inventory/{product_id}/{condition} - Returns the Inventory with a given id number
+    Keys that were never created are answered with 404 from a Bloom filter, without a query
+    Single items and lists carry an ETag and answer conditional requests with 304 Not Modified
 POST /inventory - Creates a new Inventory record in the database
+PATCH /inventory - Sets the quantity and restock level of many Inventory records
+POST /inventory/bulk - Creates many Inventory records from a JSON array or NDJSON body
+PUT /inventory/bulk - Creates or updates many Inventory records from a JSON array or NDJSON body
+PUT /inventory/active - Enables or disables updates of every Inventory matching a filter
 PUT /inventory/{product_id}/{condition} - Updates an Inventory object record in the database
+    With ?upsert=1 the record is created if it does not exist yet
 PUT /inventory/{product_id}/{condition}/active - Change an item's update status to enabled
 DELETE /inventory/{product_id}/{condition/active - Change an item's update status to disabled
 DELETE /inventory/{product_id}/{condition} - Deletes an Inventory object record in the database
+POST /inventory/{product_id}/transfer - Moves copies of a product from one condition to another
+POST /inventory/{product_id}/{condition}/adjust - Atomically adds a signed delta to an Inventory's quantity
+POST /inventory/{product_id}/{condition}/reservations - Holds copies of an Inventory for a while
+GET /inventory/changes - Returns the Inventories written or deleted after a change feed position
+GET /inventory/events - Streams Inventory writes, deletes and restock alerts as Server-Sent Events
+    Resumes after the Last-Event-ID header (or ?since=) by replaying the change feed first
+GET /reservations/{id} - Returns the Reservation with the given id
+POST /reservations/{id}/commit - Commits a held Reservation
+POST /reservations/{id}/cancel - Cancels a held Reservation and puts its copies back
 """
 
-from flask import jsonify
-from flask_restx import Resource, fields
+import hashlib
+import json
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import timezone
+from urllib.parse import urlencode
+from flask import jsonify, request, stream_with_context
+from flask_restx import Resource, fields, marshal
+from werkzeug.http import http_date, quote_etag
 from sqlalchemy import exc
-from service.models import Inventory, Condition, UpdateStatusType, DataValidationError
+from service.models import (
+    Inventory,
+    Condition,
+    UpdateStatusType,
+    DataValidationError,
+    Reservation,
+    ReservationStatus,
+    INVALIDATION_CHANNEL,
+    cache_key,
+    change_listeners,
+    db,
+    inventory_cache,
+    inventory_keys,
+    invalidate_notified,
+    restock_crossed,
+)
 from service.common import status  # HTTP Status Codes
-from service.utilities import check_condition_type
+from service.common.broker import EventBroker
+from service.common.coalescer import Coalescer
+from service.common.follower import FeedFollower
+from service.common.listener import NotificationListener
+from service.common.periodic import PeriodicTask
+from service.utilities import check_condition_type, encode_cursor, decode_cursor, encode_position, decode_position
 from . import app, api
 
 
@@ -55,6 +104,21 @@ def health():
     return {"status": "OK"}, status.HTTP_200_OK
 
 
+############################################################
+# Metrics Endpoint
+############################################################
+@app.route("/metrics")
+def metrics():
+    """Cache Counters"""
+    return {
+        "inventory_cache": inventory_cache.stats(),
+        "cache_listener": cache_listener.stats(),
+        "key_filter": inventory_keys.stats(),
+        "event_broker": event_broker.stats(),
+        "change_follower": change_follower.stats(),
+    }, status.HTTP_200_OK
+
+
 # Define the model so that the docs reflect what can be sent
 create_model = api.model(
     "Inventory",
@@ -85,6 +149,9 @@ inventory_model = api.inherit(
         "id": fields.String(
             readOnly=True, description="The unique id assigned internally by service"
         ),
+        "version": fields.Integer(
+            readOnly=True, description="The version of the item, also served as its ETag"
+        ),
     },
 )
 
@@ -98,6 +165,393 @@ update_model = api.model(
     },
 )
 
+summary_model = api.model(
+    "SummaryModel",
+    {
+        "condition": fields.String(
+            enum=Condition._member_names_, description="The condition being summarized"
+        ),
+        "count": fields.Integer(description="The number of items"),
+        "total_quantity": fields.Integer(description="The total number of copies"),
+        "restock_needed": fields.Integer(
+            description="The number of items below their restock level"
+        ),
+        "disabled": fields.Integer(description="The number of items with updates disabled"),
+    },
+)
+
+key_model = api.model(
+    "KeyModel",
+    {
+        "product_id": fields.Integer(required=True, description="The product ID"),
+        "condition": fields.String(
+            required=True,
+            enum=Condition._member_names_,
+            description="The condition of the item (i.e., NEW, OPEN_BOX, USED)",
+        ),
+    },
+)
+
+levels_model = api.inherit(
+    "LevelsModel",
+    key_model,
+    {
+        "quantity": fields.Integer(required=True, description="The counted number of copies"),
+        "restock_level": fields.Integer(required=True, description="The restock level of this item"),
+    },
+)
+
+lookup_model = api.model(
+    "LookupModel",
+    {"keys": fields.List(fields.Nested(key_model), required=True, description="The keys to look up")},
+)
+
+lookup_result_model = api.model(
+    "LookupResultModel",
+    {
+        "found": fields.List(fields.Nested(inventory_model)),
+        "missing": fields.List(fields.Nested(key_model)),
+    },
+)
+
+product_model = api.model(
+    "ProductModel",
+    {
+        "product_id": fields.Integer(description="The product ID"),
+        "total_quantity": fields.Integer(
+            description="The number of copies across all conditions"
+        ),
+        "conditions": fields.List(fields.Nested(inventory_model)),
+    },
+)
+
+adjust_model = api.model(
+    "AdjustModel",
+    {
+        "delta": fields.Integer(
+            required=True,
+            description="The signed number of copies to add to (or remove from) the quantity",
+        ),
+    },
+)
+
+status_filter_model = api.model(
+    "StatusFilterModel",
+    {
+        "can_update": fields.String(
+            required=True,
+            enum=UpdateStatusType._member_names_,
+            description="The update status to set",
+        ),
+        "condition": fields.String(
+            enum=["NEW", "OPEN_BOX", "USED"],
+            description="Only change items in this condition",
+        ),
+        "product_id_min": fields.Integer(description="Only change items with at least this product ID"),
+        "product_id_max": fields.Integer(description="Only change items with at most this product ID"),
+        "keys": fields.List(fields.Nested(key_model), description="Only change items with these keys"),
+    },
+)
+
+status_result_model = api.model(
+    "StatusResultModel",
+    {
+        "can_update": fields.String(description="The update status that was set"),
+        "updated": fields.Integer(description="The number of items whose status changed"),
+    },
+)
+
+transfer_model = api.model(
+    "TransferModel",
+    {
+        "from": fields.String(
+            required=True, enum=["NEW", "OPEN_BOX", "USED"], description="The condition to move copies out of"
+        ),
+        "to": fields.String(
+            required=True, enum=["NEW", "OPEN_BOX", "USED"], description="The condition to move copies into"
+        ),
+        "quantity": fields.Integer(required=True, description="The number of copies to move"),
+    },
+)
+
+transfer_result_model = api.model(
+    "TransferResultModel",
+    {
+        "product_id": fields.Integer(description="The product ID"),
+        "from": fields.Nested(inventory_model, description="The item copies were moved out of"),
+        "to": fields.Nested(inventory_model, description="The item copies were moved into"),
+    },
+)
+
+hold_model = api.model(
+    "HoldModel",
+    {
+        "quantity": fields.Integer(required=True, description="The number of copies to hold"),
+        "ttl": fields.Float(description="How many seconds the hold lasts before it expires"),
+    },
+)
+
+reservation_model = api.model(
+    "ReservationModel",
+    {
+        "id": fields.Integer(readOnly=True, description="The id of the Reservation"),
+        "product_id": fields.Integer(description="The product ID of the held item"),
+        "condition": fields.String(description="The condition of the held item"),
+        "quantity": fields.Integer(description="The number of copies held"),
+        "status": fields.String(
+            enum=ReservationStatus._member_names_, description="The state of the Reservation"
+        ),
+        "created_on": fields.DateTime(description="When the hold was placed"),
+        "expires_on": fields.DateTime(description="When the hold expires unless it is committed"),
+    },
+)
+
+change_model = api.model(
+    "ChangeModel",
+    {
+        "position": fields.String(description="The position of the change in the feed"),
+        "product_id": fields.Integer(description="The product ID of the changed item"),
+        "condition": fields.String(description="The condition of the changed item"),
+        "deleted": fields.Boolean(description="True if the item was deleted"),
+        "inventory": fields.Nested(
+            inventory_model, allow_null=True, description="The item as written, or null if it was deleted"
+        ),
+    },
+)
+
+change_feed_model = api.model(
+    "ChangeFeedModel",
+    {
+        "since": fields.String(description="The position the page starts after"),
+        "next": fields.String(description="The position to ask for the next page with"),
+        "more": fields.Boolean(description="True if the next page is already known to have changes"),
+        "changes": fields.List(fields.Nested(change_model)),
+    },
+)
+
+bulk_result_model = api.model(
+    "BulkResult",
+    {
+        "index": fields.Integer(description="The position of the row in the request"),
+        "product_id": fields.Integer(description="The product ID of the row"),
+        "condition": fields.String(description="The condition of the row"),
+        "status": fields.String(
+            enum=["created", "updated", "conflict", "disabled", "not_found", "invalid"],
+            description="What happened to the row",
+        ),
+        "message": fields.String(description="Why the row was not written"),
+    },
+)
+
+bulk_report_model = api.model(
+    "BulkReport",
+    {
+        "created": fields.Integer(description="The number of rows created"),
+        "updated": fields.Integer(description="The number of rows updated"),
+        "conflicts": fields.Integer(
+            description="The number of rows whose product ID and condition already exist"
+        ),
+        "disabled": fields.Integer(
+            description="The number of rows not updated because their updates are disabled"
+        ),
+        "not_found": fields.Integer(description="The number of rows that do not exist"),
+        "invalid": fields.Integer(description="The number of rows that failed validation"),
+        "results": fields.List(fields.Nested(bulk_result_model)),
+    },
+)
+
+PAGE_PARAMS = {
+    "limit": "The maximum number of Inventories to return",
+    "cursor": "The opaque cursor from the Link header of the previous page",
+    "count": "Set to 1 to return the total number of matching Inventories in X-Total-Count",
+}
+
+
+######################################################################
+#  PATH: /inventory/{product_id}/{condition}/adjust
+######################################################################
+@api.route("/inventory/<product_id>/<condition>/adjust")
+@api.param("product_id", "The product ID")
+@api.param("condition", "The condition")
+class InventoryAdjust(Resource):
+    """
+    InventoryAdjust class
+    Allows atomic changes to a single item's quantity
+    POST /inventory/{product_id}/{condition}/adjust - Add a signed delta to the item's quantity
+    """
+
+    # ------------------------------------------------------------------
+    # ADJUST THE QUANTITY OF AN ITEM
+    # ------------------------------------------------------------------
+    @api.doc("adjust_inventory")
+    @api.response(404, "Inventory not found")
+    @api.response(400, "The delta was not valid or the Inventory is disabled")
+    @api.response(409, "The quantity would become negative")
+    @api.response(503, "The coalesced adjustment was not committed in time")
+    @api.expect(adjust_model)
+    @api.marshal_with(inventory_model)
+    def post(self, product_id, condition):
+        """
+        Adjust the quantity of an Inventory object
+        This endpoint adds the posted delta to the quantity in a single database statement
+        """
+        app.logger.info(
+            "Request to Adjust an inventory object with id [%s] and condition [%s]",
+            product_id,
+            condition,
+        )
+        condition = check_condition_type(condition)
+        app.logger.debug("Payload = %s", api.payload)
+        delta = api.payload.get("delta") if isinstance(api.payload, dict) else None
+        if not isinstance(delta, int) or isinstance(delta, bool):
+            abort(status.HTTP_400_BAD_REQUEST, f"Delta is given as {delta}. It must be an integer.")
+
+        inventory = adjust(product_id, condition, delta)
+        if inventory is None:
+            # Nothing was updated, so find out why for the error message
+            inventory = Inventory.find(product_id, condition)
+            if not inventory:
+                abort(
+                    status.HTTP_404_NOT_FOUND,
+                    f"Inventory with id '{product_id}' was not found.",
+                )
+            if inventory.can_update != UpdateStatusType.ENABLED:
+                abort(
+                    status.HTTP_400_BAD_REQUEST,
+                    f"Product ID {product_id} is currently disabled and cannot be updated",
+                )
+            abort(
+                status.HTTP_409_CONFLICT,
+                f"Quantity {inventory.quantity} cannot be adjusted by {delta}. It cannot be negative.",
+            )
+        return inventory.serialize(), status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /inventory/{product_id}/{condition}/reservations
+######################################################################
+@api.route("/inventory/<product_id>/<condition>/reservations")
+@api.param("product_id", "The product ID")
+@api.param("condition", "The condition")
+class InventoryReservations(Resource):
+    """Places holds on the copies of a single item"""
+
+    # ------------------------------------------------------------------
+    # HOLD COPIES OF AN ITEM
+    # ------------------------------------------------------------------
+    @api.doc("create_reservation")
+    @api.response(404, "Inventory not found")
+    @api.response(400, "The hold was not valid or the Inventory is disabled")
+    @api.response(409, "There are not enough copies to hold")
+    @api.expect(hold_model)
+    @api.marshal_with(reservation_model, code=201)
+    def post(self, product_id, condition):
+        """
+        Hold copies of an Inventory object
+        This endpoint takes the copies out of the quantity until the hold is committed, cancelled or expires
+        """
+        app.logger.info(
+            "Request to Hold an inventory object with id [%s] and condition [%s]",
+            product_id,
+            condition,
+        )
+        condition = check_condition_type(condition)
+        app.logger.debug("Payload = %s", api.payload)
+        quantity, ttl = hold_args(api.payload)
+
+        reservation = Reservation.hold(product_id, condition, quantity, ttl)
+        if reservation is None:
+            # Nothing was held, so find out why for the error message
+            inventory = Inventory.find(product_id, condition)
+            if not inventory:
+                abort(
+                    status.HTTP_404_NOT_FOUND,
+                    f"Inventory with id '{product_id}' was not found.",
+                )
+            if inventory.can_update != UpdateStatusType.ENABLED:
+                abort(
+                    status.HTTP_400_BAD_REQUEST,
+                    f"Product ID {product_id} is currently disabled and cannot be updated",
+                )
+            abort(
+                status.HTTP_409_CONFLICT,
+                f"Only {inventory.quantity} copies are available. {quantity} cannot be held.",
+            )
+        app.logger.info("Reservation [%s] created", reservation.id)
+        location_url = api.url_for(ReservationResource, reservation_id=reservation.id, _external=True)
+        return reservation.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+
+
+######################################################################
+#  PATH: /reservations/{id}
+######################################################################
+@api.route("/reservations/<int:reservation_id>")
+@api.param("reservation_id", "The Reservation id")
+class ReservationResource(Resource):
+    """Handles a single Reservation"""
+
+    # ------------------------------------------------------------------
+    # RETRIEVE A RESERVATION
+    # ------------------------------------------------------------------
+    @api.doc("get_reservation")
+    @api.response(404, "Reservation not found")
+    @api.marshal_with(reservation_model)
+    def get(self, reservation_id):
+        """Retrieve a single Reservation"""
+        app.logger.info("Request to Retrieve reservation [%s]", reservation_id)
+        reservation = Reservation.find(reservation_id)
+        if not reservation:
+            abort(status.HTTP_404_NOT_FOUND, f"Reservation with id '{reservation_id}' was not found.")
+        return reservation.serialize(), status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /reservations/{id}/commit
+######################################################################
+@api.route("/reservations/<int:reservation_id>/commit")
+@api.param("reservation_id", "The Reservation id")
+class ReservationCommit(Resource):
+    """Commits a held Reservation"""
+
+    @api.doc("commit_reservation")
+    @api.response(404, "Reservation not found")
+    @api.response(409, "The Reservation is not held or has expired")
+    @api.marshal_with(reservation_model)
+    def post(self, reservation_id):
+        """
+        Commit a Reservation
+        This endpoint makes a hold permanent as long as it has not expired
+        """
+        app.logger.info("Request to Commit reservation [%s]", reservation_id)
+        reservation = Reservation.commit_hold(reservation_id)
+        if reservation is None:
+            reservation_conflict(reservation_id, "committed")
+        return reservation.serialize(), status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /reservations/{id}/cancel
+######################################################################
+@api.route("/reservations/<int:reservation_id>/cancel")
+@api.param("reservation_id", "The Reservation id")
+class ReservationCancel(Resource):
+    """Cancels a held Reservation"""
+
+    @api.doc("cancel_reservation")
+    @api.response(404, "Reservation not found")
+    @api.response(409, "The Reservation is not held")
+    @api.marshal_with(reservation_model)
+    def post(self, reservation_id):
+        """
+        Cancel a Reservation
+        This endpoint puts the held copies back into the Inventory
+        """
+        app.logger.info("Request to Cancel reservation [%s]", reservation_id)
+        reservation = Reservation.cancel(reservation_id)
+        if reservation is None:
+            reservation_conflict(reservation_id, "cancelled")
+        return reservation.serialize(), status.HTTP_200_OK
+
 
 ######################################################################
 #  PATH: /inventory/{product_id}/{condition}/active
@@ -119,6 +573,7 @@ class InventoryUpdateStatus(Resource):
     @api.doc("enable_item_update")
     @api.response(404, "Inventory not found")
     @api.response(400, "The posted Inventory data was not valid")
+    @api.response(412, "The Inventory is not at the version given in If-Match")
     @api.marshal_with(inventory_model)
     def put(self, product_id, condition):
         """Enable updates of a product ID"""
@@ -127,17 +582,18 @@ class InventoryUpdateStatus(Resource):
             product_id,
             condition,
         )
-        check_condition_type(condition)
-        inventory = Inventory.find(product_id, condition)
+        # check_condition_type already verified that condition is a valid enum value
+        versions = if_match_versions()
+        inventory = Inventory.set_update_status(
+            product_id, check_condition_type(condition), UpdateStatusType.ENABLED, versions
+        )
         if inventory is None:
+            check_if_match(Inventory.find(product_id, condition), versions)
             app.logger.error(
                 "Tuple (%s, %s) does not exist in database", product_id, condition
             )
             abort(status.HTTP_404_NOT_FOUND, "Invalid argument specified")
-        # check_condition_type already verified that condition is a valid enum value
         else:
-            inventory.can_update = UpdateStatusType.ENABLED
-            inventory.update()
             app.logger.info(
                 "Successfully enabled updates of product ID %s, condition %s",
                 product_id,
@@ -151,6 +607,7 @@ class InventoryUpdateStatus(Resource):
                     + condition
                 ),
                 status.HTTP_200_OK,
+                {"ETag": quote_etag(inventory_etag(inventory))},
             )
 
     # ------------------------------------------------------------------
@@ -159,6 +616,7 @@ class InventoryUpdateStatus(Resource):
     @api.doc("disable_item_update")
     @api.response(404, "Inventory not found")
     @api.response(400, "The posted Inventory data was not valid")
+    @api.response(412, "The Inventory is not at the version given in If-Match")
     @api.marshal_with(inventory_model)
     def delete(self, product_id, condition):
         """Disable updates of a product ID"""
@@ -167,17 +625,18 @@ class InventoryUpdateStatus(Resource):
             product_id,
             condition,
         )
-        check_condition_type(condition)
-        inventory = Inventory.find(product_id, condition)
+        # check_condition_type already verified that condition is a valid enum value
+        versions = if_match_versions()
+        inventory = Inventory.set_update_status(
+            product_id, check_condition_type(condition), UpdateStatusType.DISABLED, versions
+        )
         if inventory is None:
+            check_if_match(Inventory.find(product_id, condition), versions)
             app.logger.error(
                 "Tuple (%s, %s) does not exist in database", product_id, condition
             )
             abort(status.HTTP_404_NOT_FOUND, "Invalid argument specified")
-        # check_condition_type already verified that condition is a valid enum value
         else:
-            inventory.can_update = UpdateStatusType.DISABLED
-            inventory.update()
             app.logger.info(
                 "Successfully disabled updates of product ID %s, condition %s",
                 product_id,
@@ -191,6 +650,7 @@ class InventoryUpdateStatus(Resource):
                     + condition
                 ),
                 status.HTTP_204_NO_CONTENT,
+                {"ETag": quote_etag(inventory_etag(inventory))},
             )
 
 
@@ -213,12 +673,14 @@ class InventoryResource(Resource):
     # RETRIEVE AN INVENTORY OBJECT
     # ------------------------------------------------------------------
     @api.doc("get_inventory")
+    @api.response(200, "Success", inventory_model)
+    @api.response(304, "Inventory not modified")
     @api.response(404, "Inventory not found")
-    @api.marshal_with(inventory_model)
     def get(self, product_id, condition):
         """
         Retrieve a single Inventory
         This endpoint will return an Inventory object based on its product ID
+        It honours If-None-Match and If-Modified-Since with 304 Not Modified
         """
         app.logger.info(
             "Request to Retrieve an inventory object with id [%s] and condition [%s]",
@@ -232,14 +694,30 @@ class InventoryResource(Resource):
                 status.HTTP_404_NOT_FOUND,
                 f"Inventory with id '{product_id}' and condition '{condition}' was not found.",
             )
-        return inventory.serialize(), status.HTTP_200_OK
+        etag = inventory_etag(inventory)
+        last_modified = http_last_modified(inventory.last_updated_on)
+        if request.if_none_match:
+            if request.if_none_match.contains_weak(etag):
+                return not_modified(etag, last_modified=last_modified)
+        elif request.if_modified_since and last_modified <= request.if_modified_since:
+            return not_modified(etag, last_modified=last_modified)
+        return (
+            marshal(inventory.serialize(), inventory_model),
+            status.HTTP_200_OK,
+            {"ETag": quote_etag(etag), "Last-Modified": http_date(last_modified)},
+        )
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING INVENTORY
     # ------------------------------------------------------------------
-    @api.doc("update_inventory")
+    @api.doc(
+        "update_inventory",
+        params={"upsert": "Set to 1 to create the Inventory if it does not exist"},
+    )
     @api.response(404, "Inventory not found")
     @api.response(400, "The posted Inventory data was not valid")
+    @api.response(412, "The Inventory is not at the version given in If-Match")
+    @api.response(201, "Inventory created by an upsert")
     @api.expect(update_model)
     @api.marshal_with(inventory_model)
     def put(self, product_id, condition):
@@ -253,31 +731,43 @@ class InventoryResource(Resource):
             condition,
         )
 
-        check_condition_type(condition)
-        inventory = Inventory.find(product_id, condition)
+        condition = check_condition_type(condition)
+        if request.args.get("upsert", "").lower() in ("1", "true"):
+            return upsert_response(product_id, condition)
 
-        # end try/catch
-        if not inventory:
-            abort(
-                status.HTTP_404_NOT_FOUND,
-                f"Inventory with id '{product_id}' was not found.",
-            )
-        # end if
         app.logger.debug("Payload = %s", api.payload)
         data = api.payload
         if data["quantity"] > 0 and data["restock_level"] > 0:
-            if inventory.can_update == UpdateStatusType.ENABLED:
-                inventory.quantity = data["quantity"]
-                inventory.restock_level = data["restock_level"]
-                inventory.update()
-                return inventory.serialize(), status.HTTP_200_OK
+            versions = if_match_versions()
+            inventory = Inventory.update_levels(
+                product_id, condition, data["quantity"], data["restock_level"], versions
+            )
+            if inventory:
+                return (
+                    inventory.serialize(),
+                    status.HTTP_200_OK,
+                    {"ETag": quote_etag(inventory_etag(inventory))},
+                )
             # end if
 
+            # Nothing was updated, so find out why for the error message
+            inventory = Inventory.find(product_id, condition)
+            if not inventory:
+                abort(
+                    status.HTTP_404_NOT_FOUND,
+                    f"Inventory with id '{product_id}' was not found.",
+                )
+            check_if_match(inventory, versions)
             abort(
                 status.HTTP_400_BAD_REQUEST,
                 f"Product ID {product_id} is currently disabled and cannot be updated",
             )
         else:
+            if not Inventory.find(product_id, condition):
+                abort(
+                    status.HTTP_404_NOT_FOUND,
+                    f"Inventory with id '{product_id}' was not found.",
+                )
             app.logger.error(
                 "routes.py, InventoryResource::put, neg quantity and restock_levels args"
             )
@@ -312,14 +802,343 @@ class InventoryResource(Resource):
             product_id,
             condition,
         )
-        check_condition_type(condition)
-        inventory = Inventory.find(product_id, condition)
-        if inventory:
-            inventory.delete()
+        if Inventory.delete_by_key(product_id, check_condition_type(condition)):
             app.logger.info("Inventory with id [%s] was deleted", product_id)
         return "", status.HTTP_204_NO_CONTENT
 
 
+######################################################################
+#  PATH: /inventory/bulk
+######################################################################
+@api.route("/inventory/bulk")
+class InventoryBulk(Resource):
+    """Handles bulk loading of Inventories"""
+
+    # ------------------------------------------------------------------
+    # ADD MANY NEW INVENTORIES
+    # ------------------------------------------------------------------
+    @api.doc("create_inventory_bulk")
+    @api.response(400, "The posted data was not a list of Inventories")
+    @api.response(415, "The posted data was not JSON or NDJSON")
+    @api.expect([create_model])
+    @api.marshal_with(bulk_report_model)
+    def post(self):
+        """
+        Creates many Inventory objects
+        This endpoint accepts a JSON array or an NDJSON body and inserts the rows in batches,
+        returning a report with the outcome of every row
+        """
+        app.logger.info("Request to Create Inventory objects in bulk")
+        report = run_bulk(read_bulk_rows(), create_bulk_batch)
+        app.logger.info(
+            "Bulk create: [%s] created, [%s] conflicts, [%s] invalid",
+            report["created"],
+            report["conflicts"],
+            report["invalid"],
+        )
+        return report, status.HTTP_200_OK
+
+    # ------------------------------------------------------------------
+    # ADD OR UPDATE MANY INVENTORIES
+    # ------------------------------------------------------------------
+    @api.doc("upsert_inventory_bulk")
+    @api.response(400, "The posted data was not a list of Inventories")
+    @api.response(415, "The posted data was not JSON or NDJSON")
+    @api.expect([create_model])
+    @api.marshal_with(bulk_report_model)
+    def put(self):
+        """
+        Creates or updates many Inventory objects
+        This endpoint writes each row with INSERT ... ON CONFLICT DO UPDATE in batches,
+        leaving rows whose updates are disabled untouched
+        """
+        app.logger.info("Request to Upsert Inventory objects in bulk")
+        report = run_bulk(read_bulk_rows(), upsert_bulk_batch)
+        app.logger.info(
+            "Bulk upsert: [%s] created, [%s] updated, [%s] disabled, [%s] invalid",
+            report["created"],
+            report["updated"],
+            report["disabled"],
+            report["invalid"],
+        )
+        return report, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /inventory/active
+######################################################################
+@api.route("/inventory/active")
+class InventoryUpdateStatusBulk(Resource):
+    """Enables or disables updates of many Inventories at once"""
+
+    # ------------------------------------------------------------------
+    # ENABLE OR DISABLE UPDATES BY FILTER
+    # ------------------------------------------------------------------
+    @api.doc("set_update_status_bulk")
+    @api.response(400, "The status or the filter was not valid")
+    @api.expect(status_filter_model)
+    @api.marshal_with(status_result_model)
+    def put(self):
+        """
+        Enable or disable updates of many Inventory objects
+        This endpoint changes every item matching the condition, product ID range and key
+        filters in a single statement. At least one filter is required.
+        """
+        app.logger.info("Request to set the update status of many inventory objects")
+        data = api.payload if isinstance(api.payload, dict) else {}
+        try:
+            can_update = UpdateStatusType[data.get("can_update")]
+        except KeyError:
+            abort(status.HTTP_400_BAD_REQUEST, f"Invalid can_update: {data.get('can_update')}")
+        count = Inventory.set_update_status_many(can_update, **status_filter_args(data))
+        app.logger.info("Set can_update of [%s] inventory objects to %s", count, can_update.name)
+        return {"can_update": can_update.name, "updated": count}, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /inventory/lookup
+######################################################################
+@api.route("/inventory/lookup")
+class InventoryLookup(Resource):
+    """Looks up many Inventories at once"""
+
+    # ------------------------------------------------------------------
+    # LOOK UP INVENTORIES BY KEY
+    # ------------------------------------------------------------------
+    @api.doc("lookup_inventory")
+    @api.response(400, "The keys were not valid or there were too many of them")
+    @api.expect(lookup_model)
+    @api.marshal_with(lookup_result_model)
+    def post(self):
+        """
+        Look up many Inventory objects
+        This endpoint resolves a list of product ID and condition keys with a single query
+        """
+        app.logger.info("Request to Look up inventory objects")
+        keys = read_keys(api.payload.get("keys") if isinstance(api.payload, dict) else None)
+        if len(keys) > app.config["LOOKUP_MAX_KEYS"]:
+            abort(
+                status.HTTP_400_BAD_REQUEST,
+                f"Too many keys: {len(keys)}. At most {app.config['LOOKUP_MAX_KEYS']} can be looked up at once.",
+            )
+        found = Inventory.find_many(list(dict.fromkeys(keys)))
+        app.logger.info("[%s] of [%s] Inventories found", len(found), len(keys))
+        return {
+            "found": [found[key].serialize() for key in keys if key in found],
+            "missing": [
+                {"product_id": product_id, "condition": condition.name}
+                for product_id, condition in keys
+                if (product_id, condition) not in found
+            ],
+        }, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /inventory/changes
+######################################################################
+@api.route("/inventory/changes")
+class InventoryChanges(Resource):
+    """Serves the feed of Inventory writes and deletes"""
+
+    # ------------------------------------------------------------------
+    # LIST THE CHANGES AFTER A POSITION
+    # ------------------------------------------------------------------
+    @api.doc(
+        "list_inventory_changes",
+        params={
+            "since": "The position of the last change already seen (0 to start from the beginning)",
+            "limit": "The maximum number of changes to return",
+        },
+    )
+    @api.response(400, "The since or limit argument was not valid")
+    @api.marshal_with(change_feed_model)
+    def get(self):
+        """
+        List the Inventory changes after a position
+        This endpoint returns the writes and deletes in the order they happened, so that a
+        consumer can mirror the Inventories by following the next position
+        """
+        since = decode_position(request.args.get("since", "0"))
+        limit = limit_arg()
+        app.logger.info("Request for the inventory changes after [%s]", since)
+        changes = Inventory.find_changes(since, limit + 1)
+        page = changes[:limit]
+        return {
+            "since": encode_position(since),
+            "next": encode_position(page[-1][0] if page else since),
+            "more": len(changes) > limit,
+            "changes": [
+                {
+                    "position": encode_position(position),
+                    "product_id": product_id,
+                    "condition": condition.name,
+                    "deleted": inventory is None,
+                    "inventory": inventory.serialize() if inventory else None,
+                }
+                for position, inventory, (product_id, condition) in page
+            ],
+        }, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /inventory/events
+######################################################################
+@api.route("/inventory/events")
+class InventoryEvents(Resource):
+    """Streams the Inventory changes as they commit"""
+
+    # ------------------------------------------------------------------
+    # STREAM THE CHANGES AS SERVER-SENT EVENTS
+    # ------------------------------------------------------------------
+    @api.doc(
+        "stream_inventory_events",
+        params={"since": "The position of the last event already seen, if there is no Last-Event-ID header"},
+    )
+    @api.response(400, "The Last-Event-ID or since argument was not valid")
+    @api.response(503, "Too many subscribers, or the worker cannot hold a stream open")
+    def get(self):
+        """
+        Stream the Inventory changes as Server-Sent Events
+        The changes of every worker are streamed from the change feed, in feed order. Each event
+        has its position in the feed as its id and is named created, updated, deleted or restock,
+        where restock marks a quantity that went below its restock level. A client that reconnects
+        with Last-Event-ID first gets the changes it missed from the change feed; restock alerts
+        are only sent live. A client that falls behind by more than EVENTS_BUFFER_SIZE events is
+        disconnected and can resume the same way. Each stream holds a worker thread, so a worker
+        only takes as many as gunicorn.conf.py leaves room for.
+        """
+        since = request.headers.get("Last-Event-ID", request.args.get("since"))
+        if since is not None:
+            since = decode_position(since, "event id")
+        # Subscribe before replaying so that nothing committed in between is missed
+        subscription = event_broker.subscribe()
+        if subscription is None:
+            abort(status.HTTP_503_SERVICE_UNAVAILABLE, "Too many event stream subscribers.")
+        change_follower.follow()
+        app.logger.info("Request to stream inventory events after [%s]", since)
+        response = app.response_class(
+            stream_with_context(stream_events(subscription, since)), mimetype="text/event-stream"
+        )
+        response.headers["Cache-Control"] = "no-cache"
+        response.headers["X-Accel-Buffering"] = "no"
+        return response
+
+
+######################################################################
+#  PATH: /inventory/summary
+######################################################################
+@api.route("/inventory/summary")
+class InventorySummary(Resource):
+    """Summarizes the Inventories by condition"""
+
+    # ------------------------------------------------------------------
+    # SUMMARIZE INVENTORIES BY CONDITION
+    # ------------------------------------------------------------------
+    @api.doc(
+        "summarize_inventory",
+        params={"filter": "Only summarize the NEW, OPEN_BOX, USED or RESTOCK list"},
+    )
+    @api.response(400, "Unknown filter")
+    @api.marshal_list_with(summary_model)
+    def get(self):
+        """Returns counts and quantities per condition"""
+        list_filter = request.args.get("filter")
+        app.logger.info("Request to summarize items using filter: %s", list_filter)
+        inventory = filter_query(list_filter) if list_filter else Inventory.query
+        if inventory is None:
+            abort(status.HTTP_400_BAD_REQUEST, f"Unknown filter '{list_filter}'.")
+        return Inventory.summarize(inventory), status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /inventory/{product_id}
+######################################################################
+@api.route("/inventory/<int:product_id>")
+@api.param("product_id", "The product ID")
+class InventoryProduct(Resource):
+    """Handles all of the conditions of a single product"""
+
+    # ------------------------------------------------------------------
+    # RETRIEVE EVERY CONDITION OF A PRODUCT
+    # ------------------------------------------------------------------
+    @api.doc("get_inventory_product")
+    @api.response(404, "Product not found")
+    @api.marshal_with(product_model)
+    def get(self, product_id):
+        """
+        Retrieve every condition of a product
+        This endpoint returns all of the Inventory objects of a product ID with a rolled-up total
+        """
+        app.logger.info("Request to Retrieve every condition of product id [%s]", product_id)
+        inventory = Inventory.find_by_product(product_id)
+        if not inventory:
+            abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Inventory with id '{product_id}' was not found.",
+            )
+        return {
+            "product_id": product_id,
+            "total_quantity": sum(item.quantity for item in inventory),
+            "conditions": [item.serialize() for item in inventory],
+        }, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /inventory/{product_id}/transfer
+######################################################################
+@api.route("/inventory/<int:product_id>/transfer")
+@api.param("product_id", "The product ID")
+class InventoryTransfer(Resource):
+    """Moves copies of a product between conditions"""
+
+    # ------------------------------------------------------------------
+    # TRANSFER COPIES BETWEEN CONDITIONS
+    # ------------------------------------------------------------------
+    @api.doc("transfer_inventory")
+    @api.response(404, "Inventory not found")
+    @api.response(400, "The posted transfer was not valid or an item is disabled")
+    @api.response(409, "There are not enough copies to move")
+    @api.expect(transfer_model)
+    @api.marshal_with(transfer_result_model)
+    def post(self, product_id):
+        """
+        Transfer copies of a product between conditions
+        This endpoint decrements one condition and increments the other in a single transaction,
+        creating the target item if it does not exist
+        """
+        app.logger.info("Request to Transfer copies of product id [%s]", product_id)
+        app.logger.debug("Payload = %s", api.payload)
+        source, target, quantity = transfer_args(api.payload)
+        moved = Inventory.transfer(product_id, source, target, quantity)
+        if moved is None:
+            # Nothing was moved, so find out why for the error message
+            found = {item.condition: item for item in Inventory.find_by_product(product_id)}
+            if source not in found:
+                abort(
+                    status.HTTP_404_NOT_FOUND,
+                    f"Inventory with id '{product_id}' and condition '{source.name}' was not found.",
+                )
+            for condition in (source, target):
+                if condition in found and found[condition].can_update != UpdateStatusType.ENABLED:
+                    abort(
+                        status.HTTP_400_BAD_REQUEST,
+                        f"Product ID {product_id} with condition {condition.name} is currently disabled "
+                        "and cannot be updated",
+                    )
+            abort(
+                status.HTTP_409_CONFLICT,
+                f"Quantity {found[source].quantity} cannot be reduced by {quantity}. It cannot be negative.",
+            )
+        app.logger.info(
+            "Transferred [%s] of product id [%s] from %s to %s", quantity, product_id, source.name, target.name
+        )
+        return {
+            "product_id": product_id,
+            "from": moved[0].serialize(),
+            "to": moved[1].serialize(),
+        }, status.HTTP_200_OK
+
+
 ######################################################################
 #  PATH: /inventory/<listFilter>
 ######################################################################
@@ -333,30 +1152,30 @@ class InventoryListFilter(Resource):
     # ------------------------------------------------------------------
     # LIST INVENTORIES BASED ON CONDITION OR RESTOCK
     # ------------------------------------------------------------------
-    @api.doc("list_inventory_filter")
-    @api.marshal_list_with(inventory_model)
+    @api.doc(
+        "list_inventory_filter",
+        params=dict(
+            PAGE_PARAMS,
+            top="RESTOCK only: return the K most depleted items",
+            order="RESTOCK only: rank by 'deficit' (restock_level - quantity) or 'ratio' (quantity / restock_level)",
+        ),
+    )
+    @api.response(200, "Success", [inventory_model])
+    @api.response(304, "List not modified")
     def get(self, list_filter):
         """Returns a filtered list"""
         app.logger.info("Request to list items using list_filter: %s", list_filter)
-        inventory = []
-        if list_filter.upper() == "NEW":
-            inventory = Inventory.find_by_condition(Condition.NEW)
-        elif list_filter.upper() == "OPEN_BOX":
-            inventory = Inventory.find_by_condition(Condition.OPEN_BOX)
-        elif list_filter.upper() == "USED":
-            inventory = Inventory.find_by_condition(Condition.USED)
-        elif list_filter.upper() == "RESTOCK":
-            inventory = Inventory.find_by_restock()
-        else:
+        if list_filter.upper() == "RESTOCK" and ("top" in request.args or "order" in request.args):
+            top, order = restock_priority_args()
+            return list_response(Inventory.find_restock_priority(top, order), pageable=False)
+        inventory = filter_query(list_filter)
+        if inventory is None:
             app.logger.info(
                 "routes.py, InventoryListFilter::get error, unknown list_filter type: %s",
                 list_filter,
             )
             return "", status.HTTP_400_BAD_REQUEST
-        # end switch case
-        app.logger.info("[%s] Inventories returned", inventory.count())
-        results = [inventory.serialize() for inventory in inventory]
-        return results, status.HTTP_200_OK
+        return list_response(inventory)
 
 
 ######################################################################
@@ -369,15 +1188,46 @@ class InventoryCollection(Resource):
     # ------------------------------------------------------------------
     # LIST ALL INVENTORIES
     # ------------------------------------------------------------------
-    @api.doc("list_inventory")
-    @api.marshal_list_with(inventory_model)
+    @api.doc(
+        "list_inventory",
+        params=dict(PAGE_PARAMS, stream="Set to 1 to stream the list as NDJSON"),
+    )
+    @api.response(200, "Success", [inventory_model])
+    @api.response(304, "List not modified")
     def get(self):
         """Returns all of the Inventories"""
+        if wants_ndjson():
+            app.logger.info("Request to stream ALL Inventories...")
+            return stream_ndjson(
+                Inventory.stream_all(app.config["STREAM_CHUNK_SIZE"])
+            )
         app.logger.info("Request to list ALL Inventories...")
-        inventory = Inventory.all()
-        app.logger.info("[%s] Inventories returned", len(inventory))
-        results = [inventory.serialize() for inventory in inventory]
-        return results, status.HTTP_200_OK
+        return list_response(Inventory.query)
+
+    # ------------------------------------------------------------------
+    # UPDATE THE LEVELS OF MANY INVENTORIES
+    # ------------------------------------------------------------------
+    @api.doc("update_inventory_levels")
+    @api.response(400, "The posted data was not a list of Inventories")
+    @api.response(415, "The posted data was not JSON or NDJSON")
+    @api.expect([levels_model])
+    @api.marshal_with(bulk_report_model)
+    def patch(self):
+        """
+        Sets the quantity and restock level of many Inventory objects
+        This endpoint applies a cycle count with one UPDATE ... FROM VALUES per batch,
+        leaving rows whose updates are disabled untouched
+        """
+        app.logger.info("Request to Update the levels of many inventory objects")
+        report = run_bulk(read_bulk_rows(), update_levels_batch, read_levels_row)
+        app.logger.info(
+            "Batch update: [%s] updated, [%s] disabled, [%s] not found, [%s] invalid",
+            report["updated"],
+            report["disabled"],
+            report["not_found"],
+            report["invalid"],
+        )
+        return report, status.HTTP_200_OK
 
     # ------------------------------------------------------------------
     # ADD A NEW INVENTORY
@@ -439,6 +1289,664 @@ def abort(error_code: int, message: str):
     api.abort(error_code, message)
 
 
+def page_args() -> tuple:
+    """Returns the (limit, after) page selected by the limit and cursor arguments
+    Without either argument the whole list is returned in one page and limit is None
+    :rtype: tuple
+    """
+    cursor = request.args.get("cursor")
+    if request.args.get("limit") is None and cursor is None:
+        return None, None
+    return limit_arg(), decode_cursor(cursor) if cursor else None
+
+
+def limit_arg() -> int:
+    """Returns the page size selected by the limit argument, capped at MAX_PAGE_SIZE"""
+    limit = request.args.get("limit")
+    if limit is None:
+        return app.config["DEFAULT_PAGE_SIZE"]
+    if not limit.isdigit() or int(limit) < 1:
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid limit '{limit}'. It must be a positive integer.")
+    return min(int(limit), app.config["MAX_PAGE_SIZE"])
+
+
+def read_keys(keys) -> list:
+    """Reads a list of {product_id, condition} objects into (product_id, Condition) keys"""
+    if not isinstance(keys, list):
+        abort(status.HTTP_400_BAD_REQUEST, "Keys must be a list of product_id and condition objects.")
+    result = []
+    for key in keys:
+        try:
+            product_id = key["product_id"]
+            condition = Condition[key["condition"]]
+            if not isinstance(product_id, int) or condition == Condition.FINAL:
+                raise ValueError(product_id)
+        except (KeyError, TypeError, ValueError):
+            abort(status.HTTP_400_BAD_REQUEST, f"Invalid key: {key}")
+        result.append((product_id, condition))
+    return result
+
+
+def hold_args(data) -> tuple:
+    """Reads the (quantity, ttl) of a hold request"""
+    data = data if isinstance(data, dict) else {}
+    quantity = data.get("quantity")
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        abort(status.HTTP_400_BAD_REQUEST, f"Quantity is given as {quantity}. It must be positive.")
+    ttl = data.get("ttl", app.config["RESERVATION_TTL"])
+    max_ttl = app.config["RESERVATION_MAX_TTL"]
+    if not isinstance(ttl, (int, float)) or isinstance(ttl, bool) or not 0 < ttl <= max_ttl:
+        abort(status.HTTP_400_BAD_REQUEST, f"TTL is given as {ttl}. It must be between 0 and {max_ttl}.")
+    return quantity, ttl
+
+
+def reservation_conflict(reservation_id: int, action: str):
+    """Aborts a commit or cancel that did not apply with 404 or 409"""
+    reservation = Reservation.find(reservation_id)
+    if not reservation:
+        abort(status.HTTP_404_NOT_FOUND, f"Reservation with id '{reservation_id}' was not found.")
+    state = reservation.status.name
+    if reservation.status == ReservationStatus.HELD:
+        state = "expired"
+    abort(
+        status.HTTP_409_CONFLICT,
+        f"Reservation {reservation_id} is {state.lower()} and cannot be {action}.",
+    )
+
+
+def sweep_reservations():
+    """Releases the expired Reservations from the background sweeper thread"""
+    with app.app_context():
+        try:
+            Reservation.release_expired(app.config["RESERVATION_SWEEP_BATCH"])
+        finally:
+            db.session.remove()
+
+
+reservation_sweeper = PeriodicTask("reservation-sweeper", sweep_reservations)
+
+
+def adjust(product_id: str, condition: Condition, delta: int):
+    """Adds delta to the quantity of an Inventory, through the coalescer when it is running
+    A coalesced adjustment only returns once the flush that applied it has committed
+    """
+    key = cache_key(product_id, condition)
+    if key is None or not adjust_coalescer.running:
+        return Inventory.adjust_quantity(product_id, condition, delta)
+    future = adjust_coalescer.submit(key, delta)
+    try:
+        return future.result(app.config["ADJUST_COALESCE_TIMEOUT"])
+    except FutureTimeoutError:
+        abort(status.HTTP_503_SERVICE_UNAVAILABLE, "The adjustment was not committed in time.")
+    return None
+
+
+def flush_adjustments(batch: dict) -> dict:
+    """Applies the buffered deltas of the adjust coalescer, one net delta per item
+    When the net delta of an item cannot be applied, its deltas are applied one at a
+    time so that each caller gets its own outcome
+    """
+    with app.app_context():
+        try:
+            updated = Inventory.adjust_quantities({key: sum(deltas) for key, deltas in batch.items()})
+            results = {}
+            for key, deltas in batch.items():
+                if key in updated:
+                    results[key] = [updated[key]] * len(deltas)
+                else:
+                    results[key] = [Inventory.adjust_quantity(*key, delta) for delta in deltas]
+            return results
+        finally:
+            db.session.remove()
+
+
+adjust_coalescer = Coalescer("adjust-coalescer", flush_adjustments)
+
+
+def feed_events(changes: list, restocks: dict = None) -> list:
+    """Turns a page of the change feed into Server-Sent Events
+    A write whose key is in restocks, which holds the previous quantities of the writes that
+    went below their restock level, is followed by a restock alert with the same id
+    """
+    events = []
+    for position, inventory, key in changes:
+        event_id = encode_position(position)
+        restocked = restocks is not None and key in restocks
+        previous = restocks.pop(key) if restocked else None
+        if inventory is None:
+            events.append((event_id, "deleted", {"product_id": key[0], "condition": key[1].name}))
+            continue
+        data = marshal(inventory.serialize(), inventory_model)
+        events.append((event_id, "created" if inventory.version == 1 else "updated", data))
+        # A later write may already have brought the quantity back up
+        if restocked and inventory.quantity < inventory.restock_level:
+            events.append((event_id, "restock", dict(data, previous_quantity=previous)))
+    return events
+
+
+def note_restocks(restocks: dict):
+    """Keeps the restock alerts until the change follower reads their writes, if anyone is listening"""
+    if restocks and event_broker.subscribers:
+        restock_alerts.update(restocks)
+
+
+def publish_events(changes: list):
+    """Wakes the change follower for the changes of a transaction this worker committed"""
+    if not event_broker.subscribers:
+        return
+    note_restocks({change["key"]: change["previous_quantity"] for change in changes if restock_crossed(change)})
+    change_follower.wake()
+
+
+def handle_notifications(payloads: list):
+    """Evicts the Inventories other workers changed and wakes the change follower"""
+    note_restocks(invalidate_notified(payloads))
+    change_follower.wake()
+
+
+def format_event(event: tuple) -> str:
+    """Writes an (id, name, data) event in the Server-Sent Events format"""
+    event_id, name, data = event
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def replay_events(since: tuple):
+    """Yields the change feed after since as Server-Sent Events, one page at a time"""
+    while True:
+        changes = Inventory.find_changes(since, app.config["MAX_PAGE_SIZE"])
+        yield from feed_events(changes)
+        if len(changes) < app.config["MAX_PAGE_SIZE"]:
+            return
+        since = changes[-1][0]
+
+
+def stream_events(subscription, since):
+    """Writes the missed changes and then the live ones until the client goes away"""
+    try:
+        replayed = set()
+        if since is not None:
+            for event in replay_events(since):
+                replayed.add(event[0])
+                yield format_event(event)
+            # The replay ran in this request's session, so end its transaction
+            db.session.remove()
+        yield ": connected\n\n"
+        while True:
+            events = subscription.get(app.config["EVENTS_KEEPALIVE"])
+            if subscription.closed:
+                yield ": disconnected, reconnect with Last-Event-ID\n\n"
+                return
+            if not events:
+                yield ": keepalive\n\n"
+            for event in events:
+                if event[0] not in replayed:
+                    yield format_event(event)
+    finally:
+        subscription.close()
+
+
+def feed_head() -> tuple:
+    """Returns the position the change follower starts from"""
+    with app.app_context():
+        try:
+            return Inventory.feed_head()
+        finally:
+            db.session.remove()
+
+
+def read_feed(position: tuple) -> list:
+    """Reads the next page of the change feed for the change follower"""
+    with app.app_context():
+        try:
+            return Inventory.find_changes(position, app.config["MAX_PAGE_SIZE"])
+        finally:
+            db.session.remove()
+
+
+def publish_feed(changes: list):
+    """Sends a page of the change feed to the event stream subscribers"""
+    event_broker.publish(feed_events(changes, restock_alerts))
+
+
+def streaming() -> bool:
+    """True while anyone is subscribed to the event stream"""
+    if event_broker.subscribers:
+        return True
+    restock_alerts.clear()
+    return False
+
+
+event_broker = EventBroker("event-broker")
+# Previous quantities of the keys whose writes went below their restock level, by key
+restock_alerts = {}
+# Every worker publishes the changes of all of them from the change feed, in feed order,
+# woken up by its own commits and by the notifications of the others
+change_follower = FeedFollower("change-follower", feed_head, read_feed, publish_feed, streaming)
+change_listeners.append(publish_events)
+
+
+def listen_connection():
+    """Opens a connection of its own for the cache listener, outside of the pool"""
+    with app.app_context():
+        connection = db.engine.raw_connection()
+    connection.detach()
+    return connection.dbapi_connection
+
+
+def rebuild_key_filter():
+    """Rebuilds the filter of existing keys from a background thread"""
+    with app.app_context():
+        try:
+            Inventory.rebuild_key_filter(app.config["STREAM_CHUNK_SIZE"])
+        finally:
+            db.session.remove()
+
+
+def resync_caches():
+    """Drops every cached Inventory and rebuilds the key filter, after notifications may have been lost"""
+    inventory_cache.clear()
+    change_follower.wake()
+    rebuild_key_filter()
+
+
+# Evicts the Inventories other workers change and wakes the change follower; everything is
+# resynced on (re)connect, because notifications sent while the listener was away are lost
+cache_listener = NotificationListener(
+    "cache-listener", INVALIDATION_CHANNEL, listen_connection, handle_notifications, resync_caches
+)
+key_filter_rebuilder = PeriodicTask("key-filter-rebuilder", rebuild_key_filter)
+
+
+def transfer_args(data) -> tuple:
+    """Reads the (from, to, quantity) of a transfer request"""
+    data = data if isinstance(data, dict) else {}
+    conditions = []
+    for field in ("from", "to"):
+        if data.get(field) not in ("NEW", "OPEN_BOX", "USED"):
+            abort(status.HTTP_400_BAD_REQUEST, f"Invalid Condition Type for {field}: {data.get(field)}")
+        conditions.append(Condition[data[field]])
+    if conditions[0] == conditions[1]:
+        abort(status.HTTP_400_BAD_REQUEST, "The from and to conditions must be different.")
+    quantity = data.get("quantity")
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+        abort(status.HTTP_400_BAD_REQUEST, f"Quantity is given as {quantity}. It must be positive.")
+    return conditions[0], conditions[1], quantity
+
+
+def status_filter_args(data: dict) -> dict:
+    """Reads the condition, product ID range and key filters of a bulk status request"""
+    args = {}
+    if data.get("condition") is not None:
+        if data["condition"] not in ("NEW", "OPEN_BOX", "USED"):
+            abort(status.HTTP_400_BAD_REQUEST, "Invalid Condition Type.")
+        args["condition"] = Condition[data["condition"]]
+    low = data.get("product_id_min")
+    high = data.get("product_id_max")
+    if low is not None or high is not None:
+        if not all(isinstance(bound, int) for bound in (low, high)) or low > high:
+            abort(
+                status.HTTP_400_BAD_REQUEST,
+                "product_id_min and product_id_max must both be given with min <= max.",
+            )
+        args["product_ids"] = (low, high)
+    if data.get("keys") is not None:
+        args["keys"] = read_keys(data["keys"])
+        if not args["keys"]:
+            abort(status.HTTP_400_BAD_REQUEST, "Keys must not be empty.")
+    if not args:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "At least one of condition, product_id_min/product_id_max or keys is required.",
+        )
+    return args
+
+
+def filter_query(list_filter: str):
+    """Returns the query for a list filter (NEW, OPEN_BOX, USED or RESTOCK), or None if it is unknown"""
+    list_filter = list_filter.upper()
+    if list_filter == "RESTOCK":
+        return Inventory.find_by_restock()
+    if list_filter in ("NEW", "OPEN_BOX", "USED"):
+        return Inventory.find_by_condition(Condition[list_filter])
+    return None
+
+
+def list_response(query, pageable: bool = True):
+    """Builds the response of a list endpoint for one page of a query
+    The page carries a weak ETag built from its row count, latest update and keys, and an
+    If-None-Match request for an unchanged page is answered with 304 Not Modified
+    after a single aggregate query, without fetching or serializing any rows
+    Otherwise the response is built from one query; ?count=1 adds an X-Total-Count
+    header, which costs a second count query only when the list is paged
+    """
+    limit, after = page_args() if pageable else (None, None)
+    unpaged = query
+    if limit is not None:
+        # Ask for one extra row so we know whether there is a next page
+        query = Inventory.find_page(query, limit + 1, after)
+    if request.if_none_match:
+        etag = collection_etag(*Inventory.collection_meta(query))
+        if request.if_none_match.contains_weak(etag):
+            return not_modified(etag, weak=True)
+
+    inventory = query.all()
+    etag = collection_etag(
+        len(inventory),
+        max((item.last_updated_on for item in inventory), default=None),
+        Inventory.key_digest(inventory),
+    )
+    headers = {"ETag": quote_etag(etag, weak=True)}
+    if request.args.get("count", "").lower() in ("1", "true"):
+        total = len(inventory) if limit is None else Inventory.collection_meta(unpaged)[0]
+        headers["X-Total-Count"] = str(total)
+    if limit is not None and len(inventory) > limit:
+        inventory = inventory[:limit]
+        last = inventory[-1]
+        args = request.args.to_dict()
+        args.update(
+            limit=limit, cursor=encode_cursor(last.product_id, last.condition)
+        )
+        headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    app.logger.info("[%s] Inventories returned", len(inventory))
+    results = [item.serialize() for item in inventory]
+    return marshal(results, inventory_model), status.HTTP_200_OK, headers
+
+
+def restock_priority_args() -> tuple:
+    """Returns the (top, order) arguments of a restock priority list"""
+    top = request.args.get("top")
+    order = request.args.get("order", "deficit").lower()
+    if top is not None and (not top.isdigit() or int(top) < 1):
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid top '{top}'. It must be a positive integer.")
+    if order not in ("deficit", "ratio"):
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid order '{order}'. It must be deficit or ratio.")
+    if top is not None:
+        top = min(int(top), app.config["MAX_PAGE_SIZE"])
+    return top, order
+
+
+def inventory_etag(inventory: Inventory) -> str:
+    """Returns the strong ETag of a single Inventory, which is its version"""
+    return str(inventory.version)
+
+
+def if_match_versions():
+    """Returns the versions a write is conditional on from If-Match, or None if it is unconditional
+    Only strong ETags count, so a weak or unknown tag matches no version at all
+    """
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    return [int(tag) for tag in request.if_match.as_set() if tag.isdigit()]
+
+
+def check_if_match(inventory: Inventory, versions):
+    """Aborts a refused write with 412 if the Inventory exists but is not at one of the expected versions"""
+    if inventory is not None and versions is not None and inventory.version not in versions:
+        abort(
+            status.HTTP_412_PRECONDITION_FAILED,
+            f"Inventory with id '{inventory.product_id}' is at version {inventory.version}, "
+            "not the one given in If-Match.",
+        )
+
+
+def collection_etag(count: int, last_updated_on, keys: str) -> str:
+    """Returns the weak ETag of a list from its row count, latest update and key digest
+    The keys tell apart two pages with the same count and latest update, such as a page
+    where a deleted row was replaced by an older one from the next page
+    """
+    version = f"{count}:{last_updated_on.isoformat() if last_updated_on else ''}:{keys or ''}"
+    return hashlib.md5(version.encode()).hexdigest()
+
+
+def http_last_modified(last_updated_on):
+    """Converts a naive local last_updated_on into a UTC timestamp with second precision"""
+    return last_updated_on.astimezone(timezone.utc).replace(microsecond=0)
+
+
+def not_modified(etag: str, weak: bool = False, last_modified=None):
+    """Returns an empty 304 Not Modified response"""
+    response = app.response_class(status=status.HTTP_304_NOT_MODIFIED)
+    response.set_etag(etag, weak)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
+
+
+def wants_ndjson() -> bool:
+    """Checks if the client asked for an NDJSON stream instead of a JSON list"""
+    if request.args.get("stream", "").lower() in ("1", "true"):
+        return True
+    best = request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]
+    )
+    return best == "application/x-ndjson"
+
+
+def stream_ndjson(inventories):
+    """Writes Inventories to the response one NDJSON line at a time as they are read"""
+
+    def generate():
+        for inventory in inventories:
+            yield json.dumps(marshal(inventory.serialize(), inventory_model)) + "\n"
+
+    return app.response_class(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
+
+
+def read_bulk_rows() -> list:
+    """Reads the rows of a bulk request from a JSON array or an NDJSON body"""
+    if request.mimetype == "application/x-ndjson":
+        rows = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(None)
+        return rows
+    rows = api.payload
+    if not isinstance(rows, list):
+        abort(status.HTTP_400_BAD_REQUEST, "Bulk request body must be a list of Inventories")
+    return rows
+
+
+def bulk_result(position: int, row, result: str, message: str = None) -> dict:
+    """Builds the report entry for one row of a bulk request"""
+    row = row if isinstance(row, dict) else {}
+    return {
+        "index": position,
+        "product_id": row.get("product_id"),
+        "condition": row.get("condition"),
+        "status": result,
+        "message": message,
+    }
+
+
+def run_bulk(rows: list, write_batch, validate=None) -> dict:
+    """Validates the rows of a bulk request and writes them in batches
+    :param rows: the rows of the request
+    :param write_batch: writes a list of (position, row, inventory) tuples and reports on each row
+    :param validate: turns a row into an Inventory, raising DataValidationError if it is invalid
+    :return: the report of the request
+    :rtype: dict
+    """
+    validate = validate or (lambda row: Inventory().deserialize(row))
+    results = []
+    batch = []
+    seen = set()
+    for position, row in enumerate(rows):
+        try:
+            inventory = validate(row)
+        except DataValidationError as error:
+            results.append(bulk_result(position, row, "invalid", str(error)))
+            continue
+        key = (inventory.product_id, inventory.condition)
+        if key in seen:
+            results.append(bulk_result(position, row, "conflict", "Duplicate row in request"))
+            continue
+        seen.add(key)
+        batch.append((position, row, inventory))
+        if len(batch) >= app.config["BULK_BATCH_SIZE"]:
+            results.extend(write_batch(batch))
+            batch = []
+    if batch:
+        results.extend(write_batch(batch))
+    results.sort(key=lambda result: result["index"])
+    return {
+        "created": sum(result["status"] == "created" for result in results),
+        "updated": sum(result["status"] == "updated" for result in results),
+        "conflicts": sum(result["status"] == "conflict" for result in results),
+        "disabled": sum(result["status"] == "disabled" for result in results),
+        "not_found": sum(result["status"] == "not_found" for result in results),
+        "invalid": sum(result["status"] == "invalid" for result in results),
+        "results": results,
+    }
+
+
+def upsert_bulk_batch(batch: list) -> list:
+    """Creates or updates one batch of (position, row, inventory) tuples and reports on each row"""
+    written = Inventory.upsert([inventory for _, _, inventory in batch])
+    results = []
+    for position, row, inventory in batch:
+        key = (inventory.product_id, inventory.condition)
+        if key not in written:
+            results.append(
+                bulk_result(
+                    position,
+                    row,
+                    "disabled",
+                    f"Product ID {inventory.product_id} is currently disabled and cannot be updated",
+                )
+            )
+        else:
+            results.append(bulk_result(position, row, "created" if written[key][1] else "updated"))
+    return results
+
+
+def read_levels_row(row) -> Inventory:
+    """Validates one row of a batch quantity update into an Inventory holding the new levels"""
+    if not isinstance(row, dict):
+        raise DataValidationError("Invalid Inventory: body of request contained bad or no data")
+    # can_update is not written by a batch update, so any valid value passes validation here.
+    # A cycle count may find nothing on hand, so a quantity of 0 is allowed.
+    return Inventory().deserialize(dict(row, can_update=UpdateStatusType.ENABLED.name), min_quantity=0)
+
+
+def update_levels_batch(batch: list) -> list:
+    """Updates the levels of one batch of (position, row, inventory) tuples and reports on each row"""
+    updated = Inventory.update_levels_many([inventory for _, _, inventory in batch])
+    missing = [
+        (inventory.product_id, inventory.condition)
+        for _, _, inventory in batch
+        if (inventory.product_id, inventory.condition) not in updated
+    ]
+    # Rows that were not updated either do not exist or have their updates disabled
+    existing = Inventory.find_many(missing) if missing else {}
+    results = []
+    for position, row, inventory in batch:
+        key = (inventory.product_id, inventory.condition)
+        if key in updated:
+            results.append(bulk_result(position, row, "updated"))
+        elif key in existing:
+            results.append(
+                bulk_result(
+                    position,
+                    row,
+                    "disabled",
+                    f"Product ID {inventory.product_id} is currently disabled and cannot be updated",
+                )
+            )
+        else:
+            results.append(
+                bulk_result(
+                    position, row, "not_found", f"Inventory with id '{inventory.product_id}' was not found."
+                )
+            )
+    return results
+
+
+def upsert_response(product_id: str, condition: Condition):
+    """Creates or updates a single Inventory from the payload of a PUT ?upsert=1 request"""
+    data = api.payload if isinstance(api.payload, dict) else {}
+    quantity = data.get("quantity")
+    restock_level = data.get("restock_level")
+    if not isinstance(quantity, int) or quantity <= 0:
+        abort(status.HTTP_400_BAD_REQUEST, f"Quantity is given as {quantity}. It must be positive.")
+    if not isinstance(restock_level, int) or restock_level <= 0:
+        abort(status.HTTP_400_BAD_REQUEST, f"Restock is given as {restock_level}. It must be positive.")
+    if not product_id.isdigit() or int(product_id) <= 0:
+        abort(status.HTTP_400_BAD_REQUEST, f"Product ID is given as {product_id}. It must be positive.")
+    inventory = Inventory(
+        product_id=int(product_id),
+        condition=condition,
+        quantity=quantity,
+        restock_level=restock_level,
+    )
+    written = Inventory.upsert([inventory]).get((inventory.product_id, condition))
+    if written is None:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            f"Product ID {product_id} is currently disabled and cannot be updated",
+        )
+    inventory, created = written
+    if not created:
+        return inventory.serialize(), status.HTTP_200_OK
+    location_url = api.url_for(
+        InventoryResource,
+        product_id=inventory.product_id,
+        condition=inventory.condition.name,
+        _external=True,
+    )
+    return inventory.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
+
+
+def create_bulk_batch(batch: list) -> list:
+    """Inserts one batch of (position, row, inventory) tuples and reports on each row"""
+    created = Inventory.create_bulk([inventory for _, _, inventory in batch])
+    results = []
+    for position, row, inventory in batch:
+        if (inventory.product_id, inventory.condition) in created:
+            results.append(bulk_result(position, row, "created"))
+        else:
+            results.append(
+                bulk_result(
+                    position,
+                    row,
+                    "conflict",
+                    f"Inventory with id {inventory.product_id} and condition "
+                    f"{inventory.condition.name} already exists",
+                )
+            )
+    return results
+
+
 def init_db(dbname="inventory"):
     """Initialize the model"""
     Inventory.init_db(dbname)
+    event_broker.configure(app.config["EVENTS_BUFFER_SIZE"], app.config["EVENTS_MAX_SUBSCRIBERS"])
+
+
+def start_background_tasks(stream_capacity: int = None):
+    """Starts the background threads of a process that serves requests
+    This is called by the gunicorn post_worker_init hook in gunicorn.conf.py, so that
+    CLI commands and tests, which also import the app, do not start any threads
+    :param stream_capacity: how many event streams the worker can hold open while it still
+        serves other requests, if that is limited
+    """
+    if stream_capacity is not None:
+        event_broker.configure(
+            app.config["EVENTS_BUFFER_SIZE"], min(app.config["EVENTS_MAX_SUBSCRIBERS"], stream_capacity)
+        )
+    change_follower.start(app.config["EVENTS_POLL_INTERVAL"])
+    if app.config["CACHE_LISTENER"]:
+        # The key filter learns of the keys other workers create from the listener too,
+        # which rebuilds it when it connects
+        cache_listener.start(retry_delay=app.config["CACHE_LISTENER_RETRY"])
+        key_filter_rebuilder.start(app.config["KEY_FILTER_REBUILD_INTERVAL"])
+    reservation_sweeper.start(app.config["RESERVATION_SWEEP_INTERVAL"])
+    adjust_coalescer.start(
+        app.config["ADJUST_COALESCE_INTERVAL"] / 1000,
+        app.config["ADJUST_COALESCE_MAX_PENDING"],
+    )
@@ -2,7 +2,9 @@
 Utilities for Inventory API endpoints
 
 """
-
+import base64
+import binascii
+import json
 from flask import abort
 from service.common import status  # HTTP Status Codes
 from service.models import Condition
@@ -24,3 +26,39 @@ def check_condition_type(condition_str):
     except KeyError:
         app.logger.error("Invalid Condition Type.")
         abort(status.HTTP_400_BAD_REQUEST, "Invalid Condition Type.")
+
+
+def encode_cursor(product_id: int, condition: Condition) -> str:
+    """Encodes the key of the last row of a page into an opaque cursor"""
+    key = json.dumps([product_id, condition.name]).encode()
+    return base64.urlsafe_b64encode(key).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decodes an opaque cursor back into a (product_id, condition) key"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        product_id, condition = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(product_id, int):
+            raise ValueError(product_id)
+        return product_id, Condition[condition]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        app.logger.error("Invalid cursor: %s", cursor)
+        abort(status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+
+
+def encode_position(position: tuple) -> str:
+    """Encodes the (change_xid, change_seq) position of a change as "change_xid-change_seq" """
+    change_xid, change_seq = position
+    return f"{change_xid}-{change_seq}"
+
+
+def decode_position(position: str, name: str = "since") -> tuple:
+    """Decodes a position of the change feed
+    A bare change_seq, as served before positions carried the transaction, is read as (0, change_seq)
+    """
+    change_xid, separator, change_seq = position.rpartition("-")
+    if not change_seq.isdigit() or (separator and not change_xid.isdigit()):
+        app.logger.error("Invalid %s: %s", name, position)
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid {name} '{position}'. It must be a position of the change feed.")
+    return int(change_xid or 0), int(change_seq)
@@ -5,7 +5,7 @@ Define a Parent Class of Test Cases
 import os
 import logging
 import unittest
-from service.models import Inventory, db
+from service.models import Inventory, InventoryOutbox, InventoryTombstone, db, inventory_cache
 from service import app
 
 DATABASE_URI = os.getenv(
@@ -34,7 +34,10 @@ class TestInventoryModel(unittest.TestCase):
     def setUp(self):
         """This runs before each test"""
         db.session.query(Inventory).delete()  # clean up the last tests
+        db.session.query(InventoryTombstone).delete()
+        db.session.query(InventoryOutbox).delete()
         db.session.commit()
+        inventory_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
@@ -64,7 +67,10 @@ class TestResourceServer(unittest.TestCase):
         """This runs before each test"""
         self.client = app.test_client()
         db.session.query(Inventory).delete()  # clean up the last tests
+        db.session.query(InventoryTombstone).delete()
+        db.session.query(InventoryOutbox).delete()
         db.session.commit()
+        inventory_cache.clear()
 
     def tearDown(self):
         """This runs after each test"""
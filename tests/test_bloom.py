@@ -0,0 +1,72 @@
+"""
+Test cases for the Bloom Filter
+
+"""
+import threading
+from unittest import TestCase
+from service.common.bloom import BloomFilter
+
+
+class TestBloomFilter(TestCase):
+    """Test Cases for the Bloom Filter"""
+
+    def setUp(self):
+        self.bloom = BloomFilter(capacity=1000, error_rate=0.01)
+
+    def test_not_ready(self):
+        """It should let every key through until it is built"""
+        self.assertIn((1, "NEW"), self.bloom)
+        self.assertFalse(self.bloom.stats()["ready"])
+        self.bloom.configure(0, 0.01)
+        self.assertFalse(self.bloom.rebuild([], 0))
+        self.assertIn((1, "NEW"), self.bloom)
+
+    def test_rebuild(self):
+        """It should hold every key it was built from and reject most others"""
+        self.assertTrue(self.bloom.rebuild(((n, "NEW") for n in range(1000)), 1000))
+        for product_id in range(1000):
+            self.assertIn((product_id, "NEW"), self.bloom)
+        through = sum((n, "USED") in self.bloom for n in range(10000))
+        self.assertLess(through, 300)
+        stats = self.bloom.stats()
+        self.assertTrue(stats["ready"])
+        self.assertEqual(stats["keys"], 1000)
+        self.assertEqual(stats["memory_bytes"], (stats["bits"] + 7) // 8)
+        self.assertLess(stats["estimated_false_positive_rate"], 0.02)
+        self.assertEqual(stats["rejected"], 10000 - through)
+
+    def test_add(self):
+        """It should accept a key once it is added"""
+        self.bloom.rebuild([], 0)
+        self.assertNotIn((7, "NEW"), self.bloom)
+        self.bloom.add((7, "NEW"))
+        self.assertIn((7, "NEW"), self.bloom)
+
+    def test_add_during_rebuild(self):
+        """It should keep the keys added while a rebuild is reading the old ones"""
+        self.bloom.rebuild([], 0)
+        reading = threading.Event()
+        added = threading.Event()
+
+        def keys():
+            yield (1, "NEW")
+            reading.set()
+            added.wait(5)
+
+        thread = threading.Thread(target=self.bloom.rebuild, args=(keys(), 1))
+        thread.start()
+        reading.wait(5)
+        self.bloom.add((2, "NEW"))
+        self.assertFalse(self.bloom.rebuild([], 0))
+        added.set()
+        thread.join(5)
+        self.assertIn((1, "NEW"), self.bloom)
+        self.assertIn((2, "NEW"), self.bloom)
+
+    def test_observed_false_positives(self):
+        """It should report the share of absent keys that got through"""
+        self.bloom.rebuild([], 0)
+        for product_id in range(3):
+            self.assertNotIn((product_id, "NEW"), self.bloom)
+        self.bloom.false_positive()
+        self.assertEqual(self.bloom.stats()["observed_false_positive_rate"], 0.25)
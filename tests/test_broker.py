@@ -0,0 +1,67 @@
+"""
+Test cases for the Event Broker
+
+"""
+import threading
+from unittest import TestCase
+from service.common.broker import EventBroker
+
+
+class TestEventBroker(TestCase):
+    """Test Cases for the Event Broker"""
+
+    def setUp(self):
+        self.broker = EventBroker("test-broker", buffer_size=3, max_subscribers=2)
+
+    def test_fan_out(self):
+        """It should send every event to every subscriber"""
+        first = self.broker.subscribe()
+        second = self.broker.subscribe()
+        self.broker.publish(["a", "b"])
+        self.assertEqual(first.get(0), ["a", "b"])
+        self.assertEqual(second.get(0), ["a", "b"])
+        self.assertEqual(first.get(0), [])
+        self.assertEqual(self.broker.stats()["published"], 2)
+
+    def test_max_subscribers(self):
+        """It should refuse subscribers beyond max_subscribers until one leaves"""
+        first = self.broker.subscribe()
+        self.assertIsNotNone(self.broker.subscribe())
+        self.assertIsNone(self.broker.subscribe())
+        first.close()
+        self.assertIsNotNone(self.broker.subscribe())
+        self.assertEqual(self.broker.stats()["subscribers"], 2)
+
+    def test_slow_consumer(self):
+        """It should drop a subscriber whose buffer is full"""
+        slow = self.broker.subscribe()
+        fast = self.broker.subscribe()
+        self.broker.publish([1, 2])
+        self.assertEqual(fast.get(0), [1, 2])
+        self.broker.publish([3, 4])
+        self.assertTrue(slow.closed)
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.closed)
+        self.assertEqual(fast.get(0), [3, 4])
+        stats = self.broker.stats()
+        self.assertEqual(stats["slow_consumers"], 1)
+        self.assertEqual(stats["subscribers"], 1)
+
+    def test_get_waits(self):
+        """It should wake a waiting subscriber when an event is published"""
+        subscription = self.broker.subscribe()
+        received = []
+        thread = threading.Thread(target=lambda: received.extend(subscription.get(5)))
+        thread.start()
+        self.broker.publish(["x"])
+        thread.join(5)
+        self.assertEqual(received, ["x"])
+
+    def test_close_wakes(self):
+        """It should return nothing from get once the subscription is closed"""
+        subscription = self.broker.subscribe()
+        subscription.close()
+        self.assertEqual(subscription.get(5), [])
+        self.assertFalse(subscription.dropped)
+        self.broker.publish(["ignored"])
+        self.assertEqual(subscription.get(0), [])
@@ -0,0 +1,66 @@
+"""
+Test cases for the LRU Cache
+
+"""
+from unittest import TestCase
+from unittest.mock import patch
+from service.common.cache import LRUCache
+
+
+class TestLRUCache(TestCase):
+    """Test Cases for the LRU Cache"""
+
+    def test_get_and_set(self):
+        """It should count hits and misses"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["size"], 1)
+
+    def test_evict_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    @patch("service.common.cache.time.monotonic")
+    def test_expire_entries(self, monotonic):
+        """It should expire entries after the time to live"""
+        monotonic.return_value = 100.0
+        cache = LRUCache(maxsize=2, ttl=5)
+        cache.set("a", 1)
+        monotonic.return_value = 104.0
+        self.assertEqual(cache.get("a"), 1)
+        monotonic.return_value = 106.0
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expirations"], 1)
+
+    def test_invalidate_and_clear(self):
+        """It should drop invalidated and cleared entries"""
+        cache = LRUCache(maxsize=4, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.invalidate("a")
+        cache.invalidate("missing")
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+        cache.clear()
+        self.assertIsNone(cache.get("b"))
+
+    def test_disabled(self):
+        """It should not cache anything when the size is 0"""
+        cache = LRUCache(maxsize=4, ttl=60)
+        cache.configure(0, 60)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["size"], 0)
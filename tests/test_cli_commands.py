@@ -1,11 +1,14 @@
 """
 CLI Command Extensions for Flask
 """
+import json
 import os
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service.common.cli_commands import db_create, outbox_relay, sweep_reservations
+from service.common.sinks import JsonlSink
 
 
 class TestFlaskCLI(TestCase):
@@ -21,3 +24,33 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch('service.common.cli_commands.Reservation')
+    def test_sweep_reservations(self, reservation_mock):
+        """It should call the sweep-reservations command"""
+        reservation_mock.release_expired.return_value = 3
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(sweep_reservations)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Released 3", result.output)
+
+    @patch('service.common.cli_commands.InventoryOutbox')
+    def test_outbox_relay(self, outbox_mock):
+        """It should call the outbox-relay command"""
+        outbox_mock.drain.return_value = 2
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(outbox_relay, ["--output", "out.jsonl", "--batch-size", "10"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Relayed 2", result.output)
+        sink, batch_size = outbox_mock.drain.call_args[0]
+        self.assertEqual((sink.path, batch_size), ("out.jsonl", 10))
+
+    def test_jsonl_sink(self):
+        """It should append each entry as a line of JSON"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "outbox.jsonl")
+            sink = JsonlSink(path)
+            sink([{"id": 1}, {"id": 2}])
+            sink([{"id": 3}])
+            with open(path, encoding="utf-8") as output:
+                self.assertEqual([json.loads(line)["id"] for line in output], [1, 2, 3])
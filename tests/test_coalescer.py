@@ -0,0 +1,64 @@
+"""
+Test cases for the Coalescer
+
+"""
+import threading
+from unittest import TestCase
+from service.common.coalescer import Coalescer
+
+
+class TestCoalescer(TestCase):
+    """Test Cases for the Coalescer"""
+
+    def setUp(self):
+        self.batches = []
+        self.coalescer = Coalescer("test-coalescer", self._flush)
+
+    def tearDown(self):
+        self.coalescer.stop(timeout=1)
+
+    def _flush(self, batch):
+        """Records each batch and answers every value with the sum of its key"""
+        self.batches.append(batch)
+        return {key: [sum(values)] * len(values) for key, values in batch.items()}
+
+    def test_coalesce_per_key(self):
+        """It should group the values of concurrent submitters by key"""
+        self.coalescer.start(0.05, 100)
+        futures = []
+        threads = [
+            threading.Thread(target=lambda n=n: futures.append(self.coalescer.submit(n % 2, 1)))
+            for n in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(future.result(timeout=1) for future in futures), [5] * 10)
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual(sorted(self.batches[0]), [0, 1])
+
+    def test_flush_when_full(self):
+        """It should flush as soon as max_pending values are buffered"""
+        self.coalescer.start(60, 3)
+        futures = [self.coalescer.submit("a", n) for n in range(3)]
+        self.assertEqual([future.result(timeout=1) for future in futures], [3, 3, 3])
+
+    def test_flush_error(self):
+        """It should pass a failed flush on to every submitter"""
+        coalescer = Coalescer("failing-coalescer", lambda batch: 1 / 0)
+        coalescer.start(0.01, 10)
+        future = coalescer.submit("a", 1)
+        self.assertIsInstance(future.exception(timeout=1), ZeroDivisionError)
+        coalescer.stop(timeout=1)
+
+    def test_not_running(self):
+        """It should refuse values when it is not running and flush them on stop"""
+        self.assertRaises(RuntimeError, self.coalescer.submit, "a", 1)
+        self.coalescer.start(0, 10)
+        self.assertFalse(self.coalescer.running)
+        self.coalescer.start(60, 10)
+        future = self.coalescer.submit("a", 2)
+        self.coalescer.stop(timeout=1)
+        self.assertEqual(future.result(timeout=1), 2)
+        self.assertRaises(RuntimeError, self.coalescer.submit, "a", 1)
@@ -0,0 +1,68 @@
+"""
+Test cases for the Feed Follower
+
+"""
+import threading
+from unittest import TestCase
+from service.common.follower import FeedFollower
+
+
+class TestFeedFollower(TestCase):
+    """Test Cases for the Feed Follower"""
+
+    def setUp(self):
+        self.feed = []
+        self.published = []
+        self.listening = True
+        self.follower = FeedFollower("test-follower", self.head, self.read, self.published.extend, self.active)
+
+    def head(self):
+        """Returns the position of the last entry in the feed"""
+        return len(self.feed)
+
+    def read(self, position):
+        """Returns up to two (position, entry) tuples after position"""
+        return [(index + 1, entry) for index, entry in enumerate(self.feed)][position:position + 2]
+
+    def active(self):
+        """Tells the follower whether anyone is listening"""
+        return self.listening
+
+    def test_catch_up(self):
+        """It should hand over every page after the position it started from"""
+        self.feed.extend(["a", "b"])
+        self.follower.follow()
+        self.feed.extend(["c", "d", "e"])
+        self.follower.catch_up()
+        self.assertEqual([entry for _, entry in self.published], ["c", "d", "e"])
+        self.assertEqual(self.follower.position, 5)
+        self.follower.catch_up()
+        self.assertEqual(len(self.published), 3)
+        self.assertEqual(self.follower.stats()["published"], 3)
+
+    def test_inactive(self):
+        """It should not read while inactive, and start from the head once active again"""
+        self.follower.follow()
+        self.listening = False
+        self.feed.append("a")
+        self.follower.catch_up()
+        self.assertIsNone(self.follower.position)
+        self.assertEqual(self.follower.stats()["reads"], 0)
+        self.listening = True
+        self.follower.catch_up()
+        self.feed.append("b")
+        self.follower.catch_up()
+        self.assertEqual([entry for _, entry in self.published], ["b"])
+
+    def test_wake(self):
+        """It should read the feed on its background thread when woken"""
+        received = threading.Event()
+        follower = FeedFollower("woken-follower", self.head, self.read, lambda page: received.set(), self.active)
+        follower.start(60)
+        self.assertTrue(follower.running)
+        follower.follow()
+        self.feed.append("a")
+        follower.wake()
+        self.assertTrue(received.wait(1))
+        follower.stop(timeout=1)
+        self.assertFalse(follower.running)
@@ -0,0 +1,78 @@
+"""
+Test cases for the cache invalidation listener
+
+"""
+import time
+from service.models import Condition, INVALIDATION_CHANNEL, db, inventory_cache
+from service.routes import cache_listener
+from tests.factories import InventoryFactory
+from tests.parent_models import TestInventoryModel
+
+
+def wait_for(check, timeout=5.0):
+    """Polls check until it returns True or the timeout runs out"""
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class TestCacheListener(TestInventoryModel):
+    """Test Cases for the Cache Invalidation Listener"""
+
+    def setUp(self):
+        super().setUp()
+        cache_listener.start(poll_interval=0.05, retry_delay=0.05)
+        self.assertTrue(wait_for(self._listening))
+
+    def tearDown(self):
+        cache_listener.stop(timeout=1)
+        super().tearDown()
+
+    @staticmethod
+    def _listening():
+        """Checks if the listener has subscribed to the channel"""
+        count = db.session.execute(
+            db.text("SELECT count(*) FROM pg_stat_activity WHERE query = :query"),
+            {"query": f'LISTEN "{INVALIDATION_CHANNEL}"'},
+        ).scalar()
+        # pg_stat_activity is read once per transaction
+        db.session.rollback()
+        return count > 0
+
+    def test_evict_notified_keys(self):
+        """It should evict the keys another worker notifies about"""
+        inventory_cache.set((1, Condition.NEW), {"quantity": 1})
+        inventory_cache.set((2, Condition.NEW), {"quantity": 2})
+        db.session.execute(
+            db.text("SELECT pg_notify(:channel, '1:NEW'), pg_notify(:channel, 'bad')"),
+            {"channel": INVALIDATION_CHANNEL},
+        )
+        db.session.commit()
+        self.assertTrue(wait_for(lambda: inventory_cache.get((1, Condition.NEW)) is None))
+        self.assertIsNotNone(inventory_cache.get((2, Condition.NEW)))
+
+    def test_writes_notify(self):
+        """It should notify the key of each committed write, and nothing for a rollback"""
+        received = cache_listener.stats()["received"]
+        db.session.add(InventoryFactory(product_id=2, condition=Condition.NEW))
+        db.session.rollback()
+        InventoryFactory(product_id=1, condition=Condition.USED).create()
+        self.assertTrue(wait_for(lambda: cache_listener.stats()["received"] > received))
+        time.sleep(0.1)
+        self.assertEqual(cache_listener.stats()["received"], received + 1)
+
+    def test_reconnect(self):
+        """It should reconnect and drop the whole cache when its connection is lost"""
+        inventory_cache.set((1, Condition.NEW), {"quantity": 1})
+        db.session.execute(
+            db.text("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE query = :query"),
+            {"query": f'LISTEN "{INVALIDATION_CHANNEL}"'},
+        )
+        db.session.commit()
+        self.assertTrue(wait_for(lambda: cache_listener.stats()["reconnects"] > 0))
+        self.assertTrue(wait_for(self._listening))
+        self.assertTrue(wait_for(lambda: inventory_cache.get((1, Condition.NEW)) is None))
+        self.assertTrue(cache_listener.running)
@@ -0,0 +1,43 @@
+"""
+Test cases for the Periodic Tasks
+
+"""
+import threading
+from unittest import TestCase
+from service.common.periodic import PeriodicTask
+
+
+class TestPeriodicTask(TestCase):
+    """Test Cases for the Periodic Task"""
+
+    def test_runs_until_stopped(self):
+        """It should call the function repeatedly until it is stopped"""
+        calls = threading.Semaphore(0)
+        task = PeriodicTask("test-task", calls.release)
+        task.start(0.01)
+        self.assertTrue(task.running)
+        self.assertTrue(calls.acquire(timeout=1))
+        self.assertTrue(calls.acquire(timeout=1))
+        task.stop(timeout=1)
+        self.assertFalse(task.running)
+
+    def test_survives_errors(self):
+        """It should keep running after the function raises"""
+        calls = threading.Semaphore(0)
+
+        def fail():
+            calls.release()
+            raise RuntimeError("boom")
+
+        task = PeriodicTask("failing-task", fail)
+        task.start(0.01)
+        self.assertTrue(calls.acquire(timeout=1))
+        self.assertTrue(calls.acquire(timeout=1))
+        task.stop(timeout=1)
+
+    def test_disabled(self):
+        """It should not start with an interval of 0"""
+        task = PeriodicTask("idle-task", lambda: None)
+        task.start(0)
+        self.assertFalse(task.running)
+        task.stop()
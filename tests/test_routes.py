@@ -5,8 +5,15 @@ Test cases can be run with the following:
   nosetests -v --with-spec --spec-color
   coverage report -m
 """
+import json
 import logging
-from service.models import Condition
+import re
+import threading
+from sqlalchemy import event
+from service import app
+from service.models import Condition, INVALIDATION_CHANNEL, UpdateStatusType, db
+from service import routes
+from service.routes import adjust_coalescer, cache_listener, change_follower, event_broker
 from service.common import status
 from tests.factories import InventoryFactory  # HTTP Status Codes
 from tests.parent_models import TestResourceServer
@@ -14,6 +21,12 @@ from tests.parent_models import TestResourceServer
 BASE_URL = "/api/inventory"
 
 
+def next_link(response):
+    """Returns the rel="next" URL of a response's Link header, if any"""
+    match = re.match(r'<([^>]*)>; rel="next"', response.headers.get("Link", ""))
+    return match.group(1) if match else None
+
+
 class TestYourResourceServerHealth(TestResourceServer):
     """Test Cases for Inventory Resource Server Health"""
 
@@ -23,6 +36,55 @@ class TestYourResourceServerHealth(TestResourceServer):
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
 
 
+class TestYourResourceServerMetrics(TestResourceServer):
+    """Test Cases for Inventory Resource Server Metrics"""
+
+    def test_metrics(self):
+        """It should return the inventory cache counters"""
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn("hits", resp.get_json()["inventory_cache"])
+        self.assertIn("subscribers", resp.get_json()["event_broker"])
+        self.assertIn("estimated_false_positive_rate", resp.get_json()["key_filter"])
+        self.assertIn("memory_bytes", resp.get_json()["key_filter"])
+
+
+class TestYourResourceServerBackgroundTasks(TestResourceServer):
+    """Test Cases for the background threads of a serving process"""
+
+    def test_not_started_on_import(self):
+        """It should not start any background thread just by importing the app"""
+        self.assertFalse(routes.reservation_sweeper.running)
+        self.assertFalse(routes.cache_listener.running)
+        self.assertFalse(routes.key_filter_rebuilder.running)
+
+    def test_start_background_tasks(self):
+        """It should start the background threads when asked to"""
+        try:
+            routes.start_background_tasks()
+            self.assertTrue(routes.reservation_sweeper.running)
+            self.assertTrue(routes.cache_listener.running)
+            self.assertTrue(routes.key_filter_rebuilder.running)
+            self.assertTrue(routes.change_follower.running)
+        finally:
+            routes.reservation_sweeper.stop(timeout=1)
+            routes.cache_listener.stop(timeout=1)
+            routes.key_filter_rebuilder.stop(timeout=1)
+            routes.change_follower.stop(timeout=1)
+
+    def test_no_stream_capacity(self):
+        """It should refuse event streams in a worker that has no thread to spare for them"""
+        try:
+            routes.start_background_tasks(stream_capacity=0)
+            response = self.client.get(f"{BASE_URL}/events")
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        finally:
+            for task in (routes.reservation_sweeper, routes.cache_listener, routes.key_filter_rebuilder):
+                task.stop(timeout=1)
+            routes.change_follower.stop(timeout=1)
+            event_broker.configure(app.config["EVENTS_BUFFER_SIZE"], app.config["EVENTS_MAX_SUBSCRIBERS"])
+
+
 class TestYourResourceServerIndex(TestResourceServer):
     """Test Cases for Inventory Resource Server Index"""
 
@@ -94,6 +156,78 @@ class TestYourResourceServerList(TestResourceServer):
 
     # end func test_list_all_items
 
+    def test_list_all_items_ndjson_stream(self):
+        """It should stream all of the items in the inventory as NDJSON"""
+        for product_id in range(1, 6):
+            test_inventory = InventoryFactory(product_id=product_id)
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(BASE_URL, query_string={"stream": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "application/x-ndjson")
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row["product_id"] for row in rows], [1, 2, 3, 4, 5])
+
+        response = self.client.get(BASE_URL, headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 5)
+
+        response = self.client.get(BASE_URL, headers={"Accept": "application/json"})
+        self.assertEqual(response.mimetype, "application/json")
+        self.assertEqual(len(response.get_json()), 5)
+
+    def test_list_all_items_paginated(self):
+        """It should page through all of the items with a keyset cursor"""
+        for product_id in range(1, 4):
+            for condition in (Condition.NEW, Condition.OPEN_BOX, Condition.USED):
+                test_inventory = InventoryFactory(
+                    product_id=product_id, condition=condition, quantity=5, restock_level=2
+                )
+                response = self.client.post(BASE_URL, json=test_inventory.serialize())
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        keys = []
+        url = BASE_URL + "?limit=4"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            page = response.get_json()
+            self.assertLessEqual(len(page), 4)
+            keys.extend((item["product_id"], item["condition"]) for item in page)
+            url = next_link(response)
+        self.assertEqual(len(keys), 9)
+        self.assertEqual(keys[0], (1, "NEW"))
+        self.assertEqual(keys[3], (2, "NEW"))
+        self.assertEqual(keys[-1], (3, "USED"))
+
+    def test_list_items_paginated_filter(self):
+        """It should page through a filtered list"""
+        for product_id in range(1, 6):
+            test_inventory = InventoryFactory(
+                product_id=product_id, condition=Condition.USED, quantity=5, restock_level=2
+            )
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(BASE_URL + "/USED", query_string={"limit": 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["product_id"] for item in response.get_json()], [1, 2, 3])
+        next_url = next_link(response)
+
+        response = self.client.get(next_url)
+        self.assertEqual([item["product_id"] for item in response.get_json()], [4, 5])
+        self.assertNotIn("Link", response.headers)
+
+    def test_list_items_paginated_bad_arguments(self):
+        """It should reject a bad limit or cursor"""
+        response = self.client.get(BASE_URL, query_string={"limit": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL, query_string={"limit": "ten"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL + "/NEW", query_string={"cursor": "garbage"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_list_items_criteria_condition(self):
         """It should list items (based on input condition NEW, OPEN_BOX, USED) in the inventory"""
 
@@ -263,6 +397,32 @@ class TestYourResourceServerList(TestResourceServer):
 
     # end func test_list_items_criteria_restock
 
+    def test_list_items_restock_priority(self):
+        """It should list the most depleted items first"""
+        # (product_id, quantity, restock_level): deficits 5, 2, 9 and ratios .5, .8, .1
+        for product_id, quantity, restock_level in ((1, 5, 10), (2, 8, 10), (3, 1, 10), (4, 20, 10)):
+            test_inventory = InventoryFactory(
+                product_id=product_id,
+                condition=Condition.NEW,
+                quantity=quantity,
+                restock_level=restock_level,
+            )
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(BASE_URL + "/RESTOCK", query_string={"top": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["product_id"] for item in response.get_json()], [3, 1])
+
+        response = self.client.get(BASE_URL + "/RESTOCK", query_string={"order": "ratio"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["product_id"] for item in response.get_json()], [3, 1, 2])
+
+        response = self.client.get(BASE_URL + "/RESTOCK", query_string={"top": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(BASE_URL + "/RESTOCK", query_string={"order": "name"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class TestYourResourceServerCreate(TestResourceServer):
     """Test Cases for Inventory Resource Server Create"""
@@ -514,6 +674,32 @@ class TestYourResourceServerGet(TestResourceServer):
         self.assertEqual(data["quantity"], test_inventory.quantity)
         self.assertEqual(data["restock_level"], test_inventory.restock_level)
 
+    def test_get_inventory_product(self):
+        """It should Get every condition of a product with a total"""
+        for condition, quantity in ((Condition.USED, 4), (Condition.NEW, 10), (Condition.OPEN_BOX, 1)):
+            test_inventory = InventoryFactory(
+                product_id=7, condition=condition, quantity=quantity, restock_level=2
+            )
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(f"{BASE_URL}/7")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["product_id"], 7)
+        self.assertEqual(data["total_quantity"], 15)
+        self.assertEqual(
+            [item["condition"] for item in data["conditions"]], ["NEW", "OPEN_BOX", "USED"]
+        )
+
+        response = self.client.get(f"{BASE_URL}/8")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # list filters are still routed to the filtered list
+        response = self.client.get(f"{BASE_URL}/USED")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 1)
+
     def test_get_inventory_not_found(self):
         """It should not Get a inventory thats not found"""
         response = self.client.get(f"{BASE_URL}/0/NEW")
@@ -630,3 +816,943 @@ class TestYourResourceServerEnableDisableUpdate(TestResourceServer):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
     # end func test_enable_disable_update_action_error_handler
+
+
+class TestYourResourceServerBulk(TestResourceServer):
+    """Test Cases for Inventory Resource Server Bulk Create"""
+
+    def test_bulk_create_json(self):
+        """It should Create many Inventory items from a JSON array"""
+        inventories = [InventoryFactory(product_id=n) for n in range(1, 11)]
+        response = self.client.post(
+            BASE_URL + "/bulk", json=[inventory.serialize() for inventory in inventories]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.get_json()
+        self.assertEqual(report["created"], 10)
+        self.assertEqual(report["conflicts"], 0)
+        self.assertEqual(report["invalid"], 0)
+        self.assertEqual([result["index"] for result in report["results"]], list(range(10)))
+
+        response = self.client.get(BASE_URL)
+        self.assertEqual(len(response.get_json()), 10)
+
+    def test_bulk_create_ndjson(self):
+        """It should Create Inventory items from an NDJSON body"""
+        inventories = [InventoryFactory(product_id=n) for n in range(1, 4)]
+        body = "\n".join(json.dumps(inventory.serialize()) for inventory in inventories)
+        body += "\nthis is not json\n"
+        response = self.client.post(
+            BASE_URL + "/bulk", data=body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.get_json()
+        self.assertEqual(report["created"], 3)
+        self.assertEqual(report["invalid"], 1)
+        self.assertEqual(report["results"][3]["status"], "invalid")
+
+    def test_bulk_create_conflicts(self):
+        """It should report rows that conflict on product_id and condition"""
+        existing = InventoryFactory(product_id=1, condition=Condition.NEW)
+        response = self.client.post(BASE_URL, json=existing.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        fresh = InventoryFactory(product_id=2, condition=Condition.NEW)
+        bad = InventoryFactory(product_id=3, condition=Condition.NEW, quantity=0)
+        rows = [existing.serialize(), fresh.serialize(), fresh.serialize(), bad.serialize()]
+        response = self.client.post(BASE_URL + "/bulk", json=rows)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.get_json()
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["conflicts"], 2)
+        self.assertEqual(report["invalid"], 1)
+        self.assertEqual(
+            [result["status"] for result in report["results"]],
+            ["conflict", "created", "conflict", "invalid"],
+        )
+
+    def test_bulk_create_batches(self):
+        """It should commit a bulk request in several batches"""
+        app.config["BULK_BATCH_SIZE"] = 3
+        try:
+            inventories = [InventoryFactory(product_id=n) for n in range(1, 9)]
+            response = self.client.post(
+                BASE_URL + "/bulk", json=[inventory.serialize() for inventory in inventories]
+            )
+        finally:
+            app.config["BULK_BATCH_SIZE"] = 500
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["created"], 8)
+
+    def test_bulk_create_not_a_list(self):
+        """It should not Create Inventory items from a body that is not a list"""
+        response = self.client.post(BASE_URL + "/bulk", json={"product_id": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(BASE_URL + "/bulk", data="some raw string")
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_bulk_upsert(self):
+        """It should Create or Update many Inventory items and skip disabled ones"""
+        existing = InventoryFactory(
+            product_id=1, condition=Condition.NEW, quantity=5, restock_level=2
+        )
+        disabled = InventoryFactory(
+            product_id=2, condition=Condition.NEW, quantity=5, restock_level=2,
+            can_update=UpdateStatusType.DISABLED,
+        )
+        for inventory in (existing, disabled):
+            response = self.client.post(BASE_URL, json=inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        existing.quantity = 50
+        disabled.quantity = 50
+        fresh = InventoryFactory(product_id=3, quantity=7, restock_level=1)
+        rows = [existing.serialize(), disabled.serialize(), fresh.serialize(), {"product_id": 4}]
+        response = self.client.put(BASE_URL + "/bulk", json=rows)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.get_json()
+        self.assertEqual(
+            [result["status"] for result in report["results"]],
+            ["updated", "disabled", "created", "invalid"],
+        )
+        self.assertEqual(report["created"], 1)
+        self.assertEqual(report["updated"], 1)
+        self.assertEqual(report["disabled"], 1)
+        self.assertEqual(report["invalid"], 1)
+
+        self.assertEqual(self.client.get(f"{BASE_URL}/1/NEW").get_json()["quantity"], 50)
+        self.assertEqual(self.client.get(f"{BASE_URL}/2/NEW").get_json()["quantity"], 5)
+
+    def test_upsert_inventory(self):
+        """It should Create an Inventory item with PUT ?upsert=1 and then Update it"""
+        body = {"quantity": 4, "restock_level": 2}
+        response = self.client.put(f"{BASE_URL}/7/USED?upsert=1", json=body)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.headers["Location"].endswith("/inventory/7/USED"))
+        self.assertEqual(response.get_json()["quantity"], 4)
+
+        body["quantity"] = 6
+        response = self.client.put(f"{BASE_URL}/7/USED?upsert=1", json=body)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["quantity"], 6)
+        self.assertEqual(self.client.get(f"{BASE_URL}/7/USED").get_json()["quantity"], 6)
+
+    def test_upsert_inventory_bad_request(self):
+        """It should not Upsert an Inventory item that is disabled or has a bad body"""
+        response = self.client.put(f"{BASE_URL}/7/USED?upsert=1", json={"quantity": 4})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.put(
+            f"{BASE_URL}/7/USED?upsert=1", json={"quantity": -1, "restock_level": 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        disabled = InventoryFactory(
+            product_id=7, condition=Condition.USED, quantity=5, restock_level=2,
+            can_update=UpdateStatusType.DISABLED,
+        )
+        response = self.client.post(BASE_URL, json=disabled.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.put(
+            f"{BASE_URL}/7/USED?upsert=1", json={"quantity": 4, "restock_level": 2}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestYourResourceServerCoalescedAdjust(TestResourceServer):
+    """Test Cases for Inventory Resource Server Coalesced Adjustments"""
+
+    def setUp(self):
+        super().setUp()
+        test_inventory = InventoryFactory(
+            product_id=1, condition=Condition.NEW, quantity=20, restock_level=2,
+            can_update=UpdateStatusType.ENABLED,
+        )
+        response = self.client.post(BASE_URL, json=test_inventory.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        adjust_coalescer.start(0.05, 1000)
+
+    def tearDown(self):
+        adjust_coalescer.stop(timeout=1)
+        super().tearDown()
+
+    def test_coalesced_adjust(self):
+        """It should apply concurrent adjustments of one item together"""
+        codes = []
+
+        def decrement():
+            response = app.test_client().post(f"{BASE_URL}/1/NEW/adjust", json={"delta": -3})
+            codes.append(response.status_code)
+
+        threads = [threading.Thread(target=decrement) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Only six decrements of 3 fit into 20, so the net delta falls back to one at a time
+        self.assertEqual(sorted(codes), [status.HTTP_200_OK] * 6 + [status.HTTP_409_CONFLICT] * 2)
+        self.assertEqual(self.client.get(f"{BASE_URL}/1/NEW").get_json()["quantity"], 2)
+
+        response = self.client.post(f"{BASE_URL}/2/NEW/adjust", json={"delta": 1})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def read_events(stream, count):
+    """Reads count Server-Sent Events from a streamed response, skipping comments"""
+    events = []
+    while len(events) < count:
+        chunk = next(stream).decode()
+        if chunk.startswith(":"):
+            continue
+        fields_ = dict(line.split(": ", 1) for line in chunk.strip().splitlines())
+        position = tuple(int(part) for part in fields_["id"].split("-"))
+        events.append((position, fields_["event"], json.loads(fields_["data"])))
+    return events
+
+
+class TestYourResourceServerEvents(TestResourceServer):
+    """Test Cases for Inventory Resource Server Event Stream"""
+
+    def setUp(self):
+        super().setUp()
+        app.config["EVENTS_KEEPALIVE"] = 0.05
+        change_follower.start(0.05)
+
+    def tearDown(self):
+        change_follower.stop(timeout=1)
+        app.config["EVENTS_KEEPALIVE"] = 15
+        event_broker.configure(app.config["EVENTS_BUFFER_SIZE"], app.config["EVENTS_MAX_SUBSCRIBERS"])
+        super().tearDown()
+
+    def open_stream(self, **kwargs):
+        """Opens the event stream and waits until it is subscribed"""
+        response = self.client.get(f"{BASE_URL}/events", buffered=False, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        stream = iter(response.response)
+        while not next(stream).decode().startswith(": connected"):
+            pass
+        return response, stream
+
+    def test_live_events(self):
+        """It should stream creates, updates, deletes and restock alerts as they commit"""
+        response, stream = self.open_stream()
+        test_inventory = InventoryFactory(
+            product_id=1, condition=Condition.NEW, quantity=10, restock_level=5,
+            can_update=UpdateStatusType.ENABLED,
+        )
+        self.client.post(BASE_URL, json=test_inventory.serialize())
+        events = read_events(stream, 1)
+        self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": -6})
+        events += read_events(stream, 2)
+        self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": -1})
+        events += read_events(stream, 1)
+        self.client.delete(f"{BASE_URL}/1/NEW")
+        events += read_events(stream, 1)
+        response.close()
+        self.assertEqual(
+            [name for _, name, _ in events], ["created", "updated", "restock", "updated", "deleted"]
+        )
+        self.assertEqual(events[0][2]["quantity"], 10)
+        self.assertEqual(events[2][0], events[1][0])
+        self.assertEqual(events[2][2]["previous_quantity"], 10)
+        self.assertEqual(events[2][2]["quantity"], 4)
+        self.assertEqual(events[4][2], {"product_id": 1, "condition": "NEW"})
+        self.assertEqual([event_id for event_id, _, _ in events], sorted(event_id for event_id, _, _ in events))
+        self.assertEqual(event_broker.stats()["subscribers"], 0)
+
+    def test_other_worker_events(self):
+        """It should stream the changes another worker commits, woken up by its notifications"""
+        test_inventory = InventoryFactory(product_id=1, condition=Condition.NEW, quantity=10, restock_level=5)
+        self.client.post(BASE_URL, json=test_inventory.serialize())
+        cache_listener.start(poll_interval=0.05, retry_delay=0.05)
+        try:
+            response, stream = self.open_stream()
+            # Another worker's write, which only reaches this one through the database
+            with db.engine.connect() as connection:
+                connection.execute(db.text("UPDATE inventory SET quantity = 4, version = version + 1"))
+                connection.execute(db.text(f"SELECT pg_notify('{INVALIDATION_CHANNEL}', '1:NEW:10')"))
+                connection.commit()
+            events = read_events(stream, 2)
+            response.close()
+        finally:
+            cache_listener.stop(timeout=1)
+        self.assertEqual([name for _, name, _ in events], ["updated", "restock"])
+        self.assertEqual(events[1][2]["quantity"], 4)
+        self.assertEqual(events[1][2]["previous_quantity"], 10)
+
+    def test_resume(self):
+        """It should replay the changes after Last-Event-ID before the live ones"""
+        response, stream = self.open_stream()
+        for product_id in (1, 2):
+            test_inventory = InventoryFactory(product_id=product_id, condition=Condition.USED)
+            self.client.post(BASE_URL, json=test_inventory.serialize())
+        change_xid, change_seq = read_events(stream, 1)[0][0]
+        last_seen = f"{change_xid}-{change_seq}"
+        response.close()
+
+        self.client.delete(f"{BASE_URL}/1/USED")
+        response, stream = self.open_stream(headers={"Last-Event-ID": last_seen})
+        self.client.post(f"{BASE_URL}/2/USED/adjust", json={"delta": 1})
+        events = read_events(stream, 1)
+        response.close()
+        self.assertEqual(events[0][1], "updated")
+
+        response = self.client.get(
+            f"{BASE_URL}/events", buffered=False, query_string={"since": last_seen}
+        )
+        events = read_events(iter(response.response), 2)
+        response.close()
+        self.assertEqual(
+            [(name, data["product_id"]) for _, name, data in events], [("deleted", 1), ("updated", 2)]
+        )
+
+    def test_slow_consumer(self):
+        """It should disconnect a subscriber that falls too far behind"""
+        event_broker.configure(2, 100)
+        response, stream = self.open_stream()
+        for product_id in (1, 2, 3):
+            test_inventory = InventoryFactory(product_id=product_id, condition=Condition.NEW)
+            self.client.post(BASE_URL, json=test_inventory.serialize())
+        self.assertTrue(next(stream).decode().startswith(": disconnected"))
+        self.assertRaises(StopIteration, next, stream)
+        response.close()
+        self.assertGreaterEqual(event_broker.stats()["slow_consumers"], 1)
+
+    def test_events_bad_request(self):
+        """It should not accept a bad Last-Event-ID or too many subscribers"""
+        response = self.client.get(f"{BASE_URL}/events", headers={"Last-Event-ID": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        event_broker.configure(2, 0)
+        response = self.client.get(f"{BASE_URL}/events")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    def test_no_subscribers(self):
+        """It should not read the change feed while nobody is subscribed"""
+        reads = change_follower.stats()["reads"]
+        test_inventory = InventoryFactory(product_id=1, condition=Condition.NEW)
+        self.client.post(BASE_URL, json=test_inventory.serialize())
+        change_follower.catch_up()
+        self.assertEqual(change_follower.stats()["reads"], reads)
+        self.assertFalse(change_follower.stats()["following"])
+
+
+class TestYourResourceServerChanges(TestResourceServer):
+    """Test Cases for Inventory Resource Server Change Feed"""
+
+    def test_follow_changes(self):
+        """It should page through the changes after a position"""
+        since = self.client.get(f"{BASE_URL}/changes", query_string={"limit": 1000}).get_json()["next"]
+        for product_id in (1, 2, 3):
+            test_inventory = InventoryFactory(product_id=product_id, condition=Condition.NEW)
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.delete(f"{BASE_URL}/2/NEW")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since, "limit": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        page = response.get_json()
+        self.assertTrue(page["more"])
+        self.assertEqual([change["product_id"] for change in page["changes"]], [1, 3])
+        self.assertEqual(page["changes"][0]["inventory"]["product_id"], 1)
+
+        page = self.client.get(f"{BASE_URL}/changes", query_string={"since": page["next"]}).get_json()
+        self.assertFalse(page["more"])
+        self.assertEqual(len(page["changes"]), 1)
+        self.assertTrue(page["changes"][0]["deleted"])
+        self.assertIsNone(page["changes"][0]["inventory"])
+
+        page = self.client.get(f"{BASE_URL}/changes", query_string={"since": page["next"]}).get_json()
+        self.assertEqual(page["changes"], [])
+        self.assertEqual(page["next"], page["since"])
+
+    def test_changes_bad_request(self):
+        """It should not accept a bad since or limit"""
+        for since in ("-1", "1-", "a-1"):
+            response = self.client.get(f"{BASE_URL}/changes", query_string={"since": since})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{BASE_URL}/changes", query_string={"limit": "0"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestYourResourceServerIfMatch(TestResourceServer):
+    """Test Cases for Inventory Resource Server Optimistic Concurrency"""
+
+    def setUp(self):
+        super().setUp()
+        test_inventory = InventoryFactory(
+            product_id=1, condition=Condition.NEW, quantity=5, restock_level=2,
+            can_update=UpdateStatusType.ENABLED,
+        )
+        response = self.client.post(BASE_URL, json=test_inventory.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_put_if_match(self):
+        """It should Update with a current If-Match and refuse a stale one with 412"""
+        etag = self.client.get(f"{BASE_URL}/1/NEW").headers["ETag"]
+        body = {"quantity": 7, "restock_level": 2}
+        response = self.client.put(f"{BASE_URL}/1/NEW", json=body, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        new_etag = response.headers["ETag"]
+        self.assertNotEqual(new_etag, etag)
+        self.assertEqual(response.get_json()["version"], 2)
+
+        response = self.client.put(f"{BASE_URL}/1/NEW", json=body, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.put(f"{BASE_URL}/1/NEW", json=body, headers={"If-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.put(f"{BASE_URL}/2/NEW", json=body, headers={"If-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_status_if_match(self):
+        """It should honour If-Match when enabling and disabling updates"""
+        response = self.client.delete(f"{BASE_URL}/1/NEW/active", headers={"If-Match": '"9"'})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.delete(f"{BASE_URL}/1/NEW/active", headers={"If-Match": '"1"'})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.put(f"{BASE_URL}/1/NEW/active", headers={"If-Match": 'W/"2"'})
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        response = self.client.put(f"{BASE_URL}/1/NEW/active", headers={"If-Match": '"2"'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["ETag"], '"3"')
+
+
+class TestYourResourceServerBatchUpdate(TestResourceServer):
+    """Test Cases for Inventory Resource Server Batch Quantity Update"""
+
+    def test_batch_update_levels(self):
+        """It should Update the levels of many Inventory items and report on each row"""
+        for product_id, can_update in ((1, "ENABLED"), (2, "ENABLED"), (3, "DISABLED")):
+            test_inventory = InventoryFactory(
+                product_id=product_id, condition=Condition.NEW, quantity=5, restock_level=2,
+                can_update=UpdateStatusType[can_update],
+            )
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        rows = [
+            {"product_id": 1, "condition": "NEW", "quantity": 11, "restock_level": 4},
+            {"product_id": 2, "condition": "NEW", "quantity": 0, "restock_level": 4},
+            {"product_id": 3, "condition": "NEW", "quantity": 13, "restock_level": 4},
+            {"product_id": 4, "condition": "NEW", "quantity": 14, "restock_level": 4},
+            {"product_id": 1, "condition": "NEW", "quantity": 15, "restock_level": 4},
+            {"product_id": 5, "condition": "NEW", "quantity": -1, "restock_level": 4},
+        ]
+        app.config["BULK_BATCH_SIZE"] = 2
+        try:
+            response = self.client.patch(BASE_URL, json=rows)
+        finally:
+            app.config["BULK_BATCH_SIZE"] = 500
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.get_json()
+        self.assertEqual(
+            [result["status"] for result in report["results"]],
+            ["updated", "updated", "disabled", "not_found", "conflict", "invalid"],
+        )
+        self.assertEqual(report["updated"], 2)
+        self.assertEqual(report["not_found"], 1)
+
+        quantities = {item["product_id"]: item["quantity"] for item in self.client.get(BASE_URL).get_json()}
+        self.assertEqual(quantities, {1: 11, 2: 0, 3: 5})
+
+    def test_batch_update_not_a_list(self):
+        """It should not Update levels from a body that is not a list"""
+        response = self.client.patch(BASE_URL, json={"product_id": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestYourResourceServerTransfer(TestResourceServer):
+    """Test Cases for Inventory Resource Server Transfer"""
+
+    def setUp(self):
+        super().setUp()
+        test_inventory = InventoryFactory(
+            product_id=1, condition=Condition.NEW, quantity=5, restock_level=2,
+            can_update=UpdateStatusType.ENABLED,
+        )
+        response = self.client.post(BASE_URL, json=test_inventory.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_transfer(self):
+        """It should move copies between conditions in one request"""
+        response = self.client.post(
+            f"{BASE_URL}/1/transfer", json={"from": "NEW", "to": "OPEN_BOX", "quantity": 3}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual(data["from"]["quantity"], 2)
+        self.assertEqual(data["to"]["condition"], "OPEN_BOX")
+        self.assertEqual(data["to"]["quantity"], 3)
+
+        response = self.client.get(f"{BASE_URL}/1")
+        self.assertEqual(response.get_json()["total_quantity"], 5)
+
+    def test_transfer_errors(self):
+        """It should not move copies that are missing, disabled or not there"""
+        response = self.client.post(
+            f"{BASE_URL}/1/transfer", json={"from": "USED", "to": "NEW", "quantity": 1}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(
+            f"{BASE_URL}/1/transfer", json={"from": "NEW", "to": "USED", "quantity": 6}
+        )
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        response = self.client.delete(f"{BASE_URL}/1/NEW/active")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.post(
+            f"{BASE_URL}/1/transfer", json={"from": "NEW", "to": "USED", "quantity": 1}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f"{BASE_URL}/1/USED").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_transfer_bad_request(self):
+        """It should not accept a transfer with bad conditions or quantity"""
+        bodies = [
+            {"from": "NEW", "to": "NEW", "quantity": 1},
+            {"from": "NEW", "to": "FINAL", "quantity": 1},
+            {"to": "USED", "quantity": 1},
+            {"from": "NEW", "to": "USED", "quantity": 0},
+            {"from": "NEW", "to": "USED", "quantity": "1"},
+        ]
+        for body in bodies:
+            response = self.client.post(f"{BASE_URL}/1/transfer", json=body)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+
+
+class TestYourResourceServerReservations(TestResourceServer):
+    """Test Cases for Inventory Resource Server Reservations"""
+
+    def setUp(self):
+        super().setUp()
+        test_inventory = InventoryFactory(
+            product_id=1, condition=Condition.NEW, quantity=5, restock_level=2,
+            can_update=UpdateStatusType.ENABLED,
+        )
+        response = self.client.post(BASE_URL, json=test_inventory.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def _hold(self, quantity, **body):
+        """Holds copies of product 1 NEW through the API"""
+        return self.client.post(f"{BASE_URL}/1/NEW/reservations", json=dict(body, quantity=quantity))
+
+    def test_hold_commit_cancel(self):
+        """It should Hold copies and then Commit or Cancel the hold"""
+        response = self._hold(2)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        reservation = response.get_json()
+        self.assertEqual(reservation["status"], "HELD")
+        response = self.client.get(response.headers["Location"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["id"], reservation["id"])
+        self.assertEqual(self.client.get(f"{BASE_URL}/1/NEW").get_json()["quantity"], 3)
+
+        response = self.client.post(f"/api/reservations/{reservation['id']}/commit")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["status"], "COMMITTED")
+        response = self.client.post(f"/api/reservations/{reservation['id']}/cancel")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        reservation = self._hold(3).get_json()
+        self.assertEqual(self.client.get(f"{BASE_URL}/1/NEW").get_json()["quantity"], 0)
+        response = self.client.post(f"/api/reservations/{reservation['id']}/cancel")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(f"{BASE_URL}/1/NEW").get_json()["quantity"], 3)
+
+    def test_hold_errors(self):
+        """It should not Hold copies that are missing, disabled or not there"""
+        self.assertEqual(self._hold(6).status_code, status.HTTP_409_CONFLICT)
+        response = self.client.post(f"{BASE_URL}/2/NEW/reservations", json={"quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self._hold(0).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._hold(1, ttl=-1).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.delete(f"{BASE_URL}/1/NEW/active")
+        self.assertEqual(self._hold(1).status_code, status.HTTP_400_BAD_REQUEST)
+
+        for action in ("commit", "cancel"):
+            response = self.client.post(f"/api/reservations/0/{action}")
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get("/api/reservations/0")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_commit_expired(self):
+        """It should not Commit a hold that has expired"""
+        reservation = self._hold(1, ttl=0.001).get_json()
+        response = self.client.post(f"/api/reservations/{reservation['id']}/commit")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertIn("expired", response.get_json()["message"])
+
+
+class TestYourResourceServerConditionalGet(TestResourceServer):
+    """Test Cases for Inventory Resource Server Conditional Get"""
+
+    def _create(self, product_id, condition=Condition.NEW):
+        """Creates an Inventory item through the API"""
+        test_inventory = InventoryFactory(
+            product_id=product_id, condition=condition, quantity=10, restock_level=2
+        )
+        response = self.client.post(BASE_URL, json=test_inventory.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_get_inventory_etag(self):
+        """It should answer If-None-Match for an unchanged item with 304"""
+        self._create(1)
+        response = self.client.get(f"{BASE_URL}/1/NEW")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        self.assertIn("Last-Modified", response.headers)
+
+        response = self.client.get(f"{BASE_URL}/1/NEW", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.get_data(), b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+        response = self.client.put(f"{BASE_URL}/1/NEW", json={"quantity": 3, "restock_level": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(f"{BASE_URL}/1/NEW", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.get_json()["quantity"], 3)
+
+    def test_get_inventory_if_modified_since(self):
+        """It should answer If-Modified-Since for an unchanged item with 304"""
+        self._create(1)
+        response = self.client.get(f"{BASE_URL}/1/NEW")
+        last_modified = response.headers["Last-Modified"]
+
+        response = self.client.get(f"{BASE_URL}/1/NEW", headers={"If-Modified-Since": last_modified})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(
+            f"{BASE_URL}/1/NEW", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_etag(self):
+        """It should answer If-None-Match for an unchanged list with 304"""
+        self._create(1)
+        self._create(2)
+        response = self.client.get(BASE_URL)
+        etag = response.headers["ETag"]
+        self.assertTrue(etag.startswith("W/"))
+
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get(BASE_URL + "/NEW", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.delete(f"{BASE_URL}/1/NEW")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(BASE_URL, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.get_json()), 1)
+
+    def test_list_page_etag(self):
+        """It should answer If-None-Match for an unchanged page with 304"""
+        for product_id in range(1, 5):
+            self._create(product_id)
+        response = self.client.get(BASE_URL, query_string={"limit": 2})
+        etag = response.headers["ETag"]
+        response = self.client.get(
+            BASE_URL, query_string={"limit": 2}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # a change past the end of the page does not change the page
+        response = self.client.put(f"{BASE_URL}/4/NEW", json={"quantity": 3, "restock_level": 2})
+        response = self.client.get(
+            BASE_URL, query_string={"limit": 2}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_page_etag_slide(self):
+        """It should not answer 304 once a deleted row is replaced by an older one"""
+        for product_id in (4, 1, 2, 3):
+            self._create(product_id)
+        response = self.client.get(BASE_URL, query_string={"limit": 2})
+        etag = response.headers["ETag"]
+        # the page window keeps its count and latest update, but 4 slides in for 2
+        response = self.client.delete(f"{BASE_URL}/2/NEW")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get(
+            BASE_URL, query_string={"limit": 2}, headers={"If-None-Match": etag}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["product_id"] for item in response.get_json()], [1, 3])
+
+
+class TestYourResourceServerAdjust(TestResourceServer):
+    """Test Cases for Inventory Resource Server Adjust"""
+
+    def setUp(self):
+        super().setUp()
+        test_inventory = InventoryFactory(
+            product_id=1, condition=Condition.NEW, quantity=10, restock_level=2
+        )
+        response = self.client.post(BASE_URL, json=test_inventory.serialize())
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_adjust_quantity(self):
+        """It should add a signed delta to the quantity"""
+        response = self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": -4})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["quantity"], 6)
+
+        response = self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["quantity"], 11)
+
+        response = self.client.get(f"{BASE_URL}/1/NEW")
+        self.assertEqual(response.get_json()["quantity"], 11)
+
+    def test_adjust_quantity_floor(self):
+        """It should not adjust the quantity below zero"""
+        response = self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": -10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json()["quantity"], 0)
+
+        response = self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": -1})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    def test_adjust_quantity_disabled(self):
+        """It should not adjust the quantity of a disabled item"""
+        response = self.client.delete(f"{BASE_URL}/1/NEW/active")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_adjust_quantity_errors(self):
+        """It should reject a bad delta or an unknown item"""
+        response = self.client.post(f"{BASE_URL}/2/NEW/adjust", json={"delta": 1})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.post(f"{BASE_URL}/1/NEW/adjust", json={"delta": "1"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/1/NEW/adjust", json={})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(f"{BASE_URL}/1/FOO/adjust", json={"delta": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestYourResourceServerListQueries(TestResourceServer):
+    """Test Cases for the number of SQL statements run by the list endpoints"""
+
+    def setUp(self):
+        super().setUp()
+        for product_id in range(1, 6):
+            test_inventory = InventoryFactory(
+                product_id=product_id, condition=Condition.NEW, quantity=1, restock_level=5
+            )
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.statements = []
+        event.listen(db.engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self._count)
+        super().tearDown()
+
+    def _count(self, conn, cursor, statement, *args):  # pylint: disable=unused-argument
+        """Records every statement sent to the database"""
+        self.statements.append(statement)
+
+    def _get(self, url, **kwargs):
+        """Runs a GET and returns the response and the number of statements it ran"""
+        db.session.remove()
+        self.statements.clear()
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(self.statements)
+
+    def test_list_filter_single_query(self):
+        """It should run a single query per filtered list request"""
+        for list_filter in ("NEW", "USED", "RESTOCK"):
+            _, statements = self._get(f"{BASE_URL}/{list_filter}")
+            self.assertEqual(statements, 1, list_filter)
+        _, statements = self._get(f"{BASE_URL}/NEW", query_string={"limit": 2})
+        self.assertEqual(statements, 1)
+        _, statements = self._get(f"{BASE_URL}/RESTOCK", query_string={"top": 2})
+        self.assertEqual(statements, 1)
+        _, statements = self._get(BASE_URL)
+        self.assertEqual(statements, 1)
+
+    def test_writes_single_statement(self):
+        """It should run a single statement per update, status change and delete, plus the outbox INSERT"""
+        requests = [
+            (self.client.put, f"{BASE_URL}/1/NEW", {"quantity": 3, "restock_level": 2}),
+            (self.client.delete, f"{BASE_URL}/1/NEW/active", None),
+            (self.client.put, f"{BASE_URL}/1/NEW/active", None),
+            (self.client.delete, f"{BASE_URL}/1/NEW", None),
+        ]
+        for method, url, body in requests:
+            db.session.remove()
+            self.statements.clear()
+            response = method(url, json=body)
+            self.assertLess(response.status_code, 300, url)
+            self.assertEqual(len(self.statements), 2, url)
+            self.assertIn("INSERT INTO inventory_outbox", self.statements[-1])
+
+    def test_list_filter_total_count(self):
+        """It should only count the whole list when asked to"""
+        response, statements = self._get(f"{BASE_URL}/NEW", query_string={"count": 1})
+        self.assertEqual(response.headers["X-Total-Count"], "5")
+        self.assertEqual(statements, 1)
+
+        response, statements = self._get(f"{BASE_URL}/NEW", query_string={"count": 1, "limit": 2})
+        self.assertEqual(response.headers["X-Total-Count"], "5")
+        self.assertEqual(len(response.get_json()), 2)
+        self.assertEqual(statements, 2)
+
+        response, _ = self._get(f"{BASE_URL}/NEW")
+        self.assertNotIn("X-Total-Count", response.headers)
+
+
+class TestYourResourceServerSummary(TestResourceServer):
+    """Test Cases for Inventory Resource Server Summary"""
+
+    def test_summary(self):
+        """It should summarize the inventory by condition"""
+        rows = (
+            (1, Condition.NEW, 10, 5),
+            (2, Condition.NEW, 3, 5),
+            (3, Condition.USED, 1, 2),
+        )
+        for product_id, condition, quantity, restock_level in rows:
+            test_inventory = InventoryFactory(
+                product_id=product_id, condition=condition, quantity=quantity, restock_level=restock_level
+            )
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.delete(f"{BASE_URL}/1/NEW/active")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get(BASE_URL + "/summary")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.get_json(),
+            [
+                {"condition": "NEW", "count": 2, "total_quantity": 13, "restock_needed": 1, "disabled": 1},
+                {"condition": "USED", "count": 1, "total_quantity": 1, "restock_needed": 1, "disabled": 0},
+            ],
+        )
+
+        response = self.client.get(BASE_URL + "/summary", query_string={"filter": "RESTOCK"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["total_quantity"] for row in response.get_json()], [3, 1])
+
+        response = self.client.get(BASE_URL + "/summary", query_string={"filter": "USED"})
+        self.assertEqual([row["condition"] for row in response.get_json()], ["USED"])
+
+        response = self.client.get(BASE_URL + "/summary", query_string={"filter": "FOO"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestYourResourceServerStatusBulk(TestResourceServer):
+    """Test Cases for Inventory Resource Server Bulk Update Status"""
+
+    def setUp(self):
+        super().setUp()
+        for product_id in range(1, 6):
+            for condition in (Condition.NEW, Condition.USED):
+                test_inventory = InventoryFactory(
+                    product_id=product_id, condition=condition, quantity=5, restock_level=1,
+                    can_update=UpdateStatusType.ENABLED,
+                )
+                response = self.client.post(BASE_URL, json=test_inventory.serialize())
+                self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def _disabled(self):
+        """Returns the keys of the Inventory items with updates disabled"""
+        return {
+            (item["product_id"], item["condition"])
+            for item in self.client.get(BASE_URL).get_json()
+            if item["can_update"] == "DISABLED"
+        }
+
+    def test_freeze_by_filters(self):
+        """It should Disable updates of every item matching the filters"""
+        response = self.client.put(
+            BASE_URL + "/active",
+            json={"can_update": "DISABLED", "condition": "USED", "product_id_min": 2, "product_id_max": 3},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.get_json(), {"can_update": "DISABLED", "updated": 2})
+        self.assertEqual(self._disabled(), {(2, "USED"), (3, "USED")})
+
+        response = self.client.put(
+            BASE_URL + "/active",
+            json={"can_update": "DISABLED", "keys": [{"product_id": 2, "condition": "USED"},
+                                                     {"product_id": 5, "condition": "NEW"}]},
+        )
+        self.assertEqual(response.get_json()["updated"], 1)
+        response = self.client.put(f"{BASE_URL}/5/NEW", json={"quantity": 3, "restock_level": 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put(BASE_URL + "/active", json={"can_update": "ENABLED", "condition": "USED"})
+        self.assertEqual(response.get_json()["updated"], 2)
+        self.assertEqual(self._disabled(), {(5, "NEW")})
+
+    def test_freeze_bad_request(self):
+        """It should not change update statuses without a valid status and filter"""
+        bodies = [
+            {"condition": "NEW"},
+            {"can_update": "MAYBE", "condition": "NEW"},
+            {"can_update": "DISABLED"},
+            {"can_update": "DISABLED", "condition": "FINAL"},
+            {"can_update": "DISABLED", "product_id_min": 3},
+            {"can_update": "DISABLED", "product_id_min": 3, "product_id_max": 1},
+            {"can_update": "DISABLED", "keys": []},
+            {"can_update": "DISABLED", "keys": [{"product_id": "a", "condition": "NEW"}]},
+        ]
+        for body in bodies:
+            response = self.client.put(BASE_URL + "/active", json=body)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        self.assertEqual(self._disabled(), set())
+
+
+class TestYourResourceServerLookup(TestResourceServer):
+    """Test Cases for Inventory Resource Server Lookup"""
+
+    def test_lookup(self):
+        """It should look up many items and report the missing ones"""
+        for product_id in (1, 2, 3):
+            test_inventory = InventoryFactory(
+                product_id=product_id, condition=Condition.NEW, quantity=product_id, restock_level=1
+            )
+            response = self.client.post(BASE_URL, json=test_inventory.serialize())
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # warm the cache for one of the keys
+        self.client.get(f"{BASE_URL}/2/NEW")
+
+        keys = [
+            {"product_id": 3, "condition": "NEW"},
+            {"product_id": 2, "condition": "NEW"},
+            {"product_id": 1, "condition": "USED"},
+            {"product_id": 1, "condition": "NEW"},
+        ]
+        response = self.client.post(BASE_URL + "/lookup", json={"keys": keys})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.get_json()
+        self.assertEqual([item["product_id"] for item in data["found"]], [3, 2, 1])
+        self.assertEqual([item["quantity"] for item in data["found"]], [3, 2, 1])
+        self.assertEqual(data["missing"], [{"product_id": 1, "condition": "USED"}])
+
+    def test_lookup_bad_keys(self):
+        """It should reject bad keys and batches that are too large"""
+        response = self.client.post(BASE_URL + "/lookup", json={"keys": [{"product_id": 1}]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(
+            BASE_URL + "/lookup", json={"keys": [{"product_id": "1", "condition": "NEW"}]}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(BASE_URL + "/lookup", json=[])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        app.config["LOOKUP_MAX_KEYS"] = 2
+        try:
+            keys = [{"product_id": n, "condition": "NEW"} for n in range(1, 4)]
+            response = self.client.post(BASE_URL + "/lookup", json={"keys": keys})
+        finally:
+            app.config["LOOKUP_MAX_KEYS"] = 500
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)